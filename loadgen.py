@@ -0,0 +1,257 @@
+"""
+Concurrent load generator for the social network API.
+
+Populates users and posts, then sends an open-loop stream of requests drawn
+from the scenario mix in config.json and prints per-endpoint throughput and
+latency percentiles as JSON.
+
+    python loadgen.py --output results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+import aiohttp
+from faker import Faker
+
+fake = Faker()
+
+
+def load_config(file_path):
+    with open(file_path) as config_file:
+        return json.load(config_file)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """
+    Collects latencies per endpoint once the warm-up phase is over.
+    """
+
+    def __init__(self):
+        self.recording = False
+        self.started = None
+        self.finished = None
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def start(self):
+        self.recording = True
+        self.started = time.monotonic()
+
+    def stop(self):
+        self.recording = False
+        self.finished = time.monotonic()
+
+    def record(self, endpoint, started, latency, ok):
+        if not self.recording or started < self.started:
+            return
+        self.latencies[endpoint].append(latency)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def report(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[endpoint] = {
+                'requests': len(latencies),
+                'errors': self.errors[endpoint],
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, session, base_url, recorder):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.users = []
+        self.post_ids = []
+
+    async def request(self, endpoint, method, path, scheduled=None, token=None,
+                      **kwargs):
+        """
+        Sends one request and records its latency, measured from the time it
+        was scheduled so queueing behind the concurrency limit is included.
+        """
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        started = scheduled if scheduled is not None else time.monotonic()
+        try:
+            async with self.session.request(method, self.base_url + path,
+                                            headers=headers, **kwargs) as response:
+                body = await response.json(content_type=None)
+                # Liking an already liked post is a normal outcome under load
+                ok = response.status < 400 or (
+                    response.status == 400 and endpoint == 'like')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            body, ok = None, False
+        self.recorder.record(endpoint, started, time.monotonic() - started, ok)
+        return body if ok else None
+
+    async def signup(self, scheduled=None):
+        user = {
+            'username': f'{fake.user_name()}{random.randint(0, 10 ** 9)}',
+            'password': fake.password(length=12, special_chars=False),
+        }
+        body = await self.request('signup', 'POST', '/api/users/signup/', scheduled,
+                                  json={**user, 'email': fake.email()})
+        if body is not None:
+            self.users.append(user)
+            return user
+        return None
+
+    async def login(self, user=None, scheduled=None):
+        user = user or random.choice(self.users)
+        body = await self.request('login', 'POST', '/api/users/login/', scheduled,
+                                  json={'username': user['username'],
+                                        'password': user['password']})
+        if body is not None:
+            user['token'] = body['access']
+        return user
+
+    async def create_post(self, user=None, scheduled=None):
+        user = user or self._logged_in_user()
+        body = await self.request('post', 'POST', '/api/posts/', scheduled,
+                                  token=user['token'],
+                                  json={'title': fake.sentence()[:80],
+                                        'body': fake.text()})
+        if body is not None:
+            post_id = body.get('id') or body.get('post', {}).get('id')
+            if post_id:
+                self.post_ids.append(post_id)
+
+    async def like(self, scheduled=None):
+        user = self._logged_in_user()
+        post_id = random.choice(self.post_ids)
+        await self.request('like', 'POST', f'/api/posts/{post_id}/like/?response=compact',
+                           scheduled, token=user['token'])
+
+    async def analytics(self, scheduled=None):
+        user = self._logged_in_user()
+        date_to = time.strftime('%Y-%m-%d')
+        date_from = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 30 * 86400))
+        await self.request('analytics', 'GET', '/api/posts/analytics/', scheduled,
+                           token=user['token'],
+                           params={'date_from': date_from, 'date_to': date_to})
+
+    async def populate(self, number_of_users, posts_per_user, concurrency):
+        """
+        Creates users, logs them in and creates their posts concurrently.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        await asyncio.gather(*(limited(self.signup()) for _ in range(number_of_users)))
+        await asyncio.gather(*(limited(self.login(user)) for user in self.users))
+        await asyncio.gather(*(
+            limited(self.create_post(user))
+            for user in self.users if 'token' in user
+            for _ in range(random.randint(1, posts_per_user))))
+
+    async def run(self, scenario, arrival_rate, concurrency, warmup, duration):
+        """
+        Open-loop run: requests arrive as a Poisson process at arrival_rate
+        per second whatever the response times are, with at most concurrency
+        of them in flight. Only requests arriving after the warm-up count.
+        """
+        operations = {
+            'signup': self.signup,
+            'login': self.login,
+            'post': self.create_post,
+            'like': self.like,
+            'analytics': self.analytics,
+        }
+        names = [name for name, weight in scenario.items() if weight > 0]
+        weights = [scenario[name] for name in names]
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        async def send(operation, scheduled):
+            async with semaphore:
+                await operation(scheduled=scheduled)
+
+        loop_started = time.monotonic()
+        next_arrival = loop_started
+        recording_from = loop_started + warmup
+        stop_at = recording_from + duration
+        while next_arrival < stop_at:
+            now = time.monotonic()
+            if not self.recorder.recording and now >= recording_from:
+                self.recorder.start()
+            if next_arrival > now:
+                await asyncio.sleep(next_arrival - now)
+            operation = operations[random.choices(names, weights)[0]]
+            task = asyncio.create_task(send(operation, next_arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_arrival += random.expovariate(arrival_rate)
+        if not self.recorder.recording:
+            self.recorder.start()
+        await asyncio.gather(*tasks)
+        self.recorder.stop()
+
+    def _logged_in_user(self):
+        return random.choice([user for user in self.users if 'token' in user])
+
+
+async def main(args):
+    config = load_config(args.config)['load_test']
+    concurrency = args.concurrency or config['concurrency']
+    arrival_rate = args.rate or config['arrival_rate']
+    duration = args.duration or config['duration']
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=config.get('timeout', 30))
+    recorder = Recorder()
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        generator = LoadGenerator(session, args.base_url or config['base_url'], recorder)
+        await generator.populate(config['number_of_users'],
+                                 config['max_posts_per_user'], concurrency)
+        if not generator.post_ids:
+            raise SystemExit('Population failed, is the server running?')
+        await generator.run(config['scenario'], arrival_rate, concurrency,
+                            config['warmup'], duration)
+    report = recorder.report()
+    report['config'] = {**config, 'concurrency': concurrency,
+                        'arrival_rate': arrival_rate, 'duration': duration}
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load generator for the social network API')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--base-url')
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--rate', type=float, help='Arrival rate in requests per second')
+    parser.add_argument('--duration', type=float, help='Measured seconds after warm-up')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+logger = logging.getLogger('api')
+
+
+class LastSeenTracker:
+    """
+    Write-behind buffer for ApiUser.last_request. Hits from the same user are
+    merged in memory and written with a single bulk UPDATE once the flush
+    interval has passed or the buffer holds flush_size distinct users.
+
+    A daemon thread, started on the first hit in every process, also
+    flushes once the interval has passed, so an idle worker is at most
+    about flush_interval seconds behind. Hits still buffered when a worker
+    is killed without running its atexit hooks are lost.
+    """
+
+    def __init__(self, flush_interval=30, flush_size=500):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer_pid = None
+        self._stopped = threading.Event()
+
+    def touch(self, user_id, timestamp):
+        """
+        Records a request made by the user at the given time.
+        :param user_id: int
+        :param timestamp: datetime
+        """
+        if self._record(user_id, timestamp):
+            self.flush()
+
+    async def atouch(self, user_id, timestamp):
+        """
+        Async counterpart of touch, flushing in a worker thread when due.
+        :param user_id: int
+        :param timestamp: datetime
+        """
+        if self._record(user_id, timestamp):
+            await sync_to_async(self.flush)()
+
+    def _record(self, user_id, timestamp):
+        with self._lock:
+            # Forked workers do not inherit the parent's timer thread
+            if self._timer_pid != os.getpid():
+                self._timer_pid = os.getpid()
+                threading.Thread(target=self._run_timer, name='last-seen-flush',
+                                 daemon=True).start()
+            current = self._pending.get(user_id)
+            if current is None or timestamp > current:
+                self._pending[user_id] = timestamp
+            return len(self._pending) >= self.flush_size or self._due()
+
+    def _due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _run_timer(self):
+        while not self._stopped.wait(self.flush_interval):
+            with self._lock:
+                due = bool(self._pending) and self._due()
+            if due:
+                self.flush()
+                # Database connections are per thread, and this one would
+                # otherwise stay open between flushes
+                connections.close_all()
+
+    def stop(self):
+        """
+        Stops the timer thread and writes what is still buffered.
+        """
+        self._stopped.set()
+        self.flush()
+
+    def pending(self, user_id):
+        """
+        Returns the buffered last_request of the user, or None.
+        :param user_id: int
+        :return: datetime | None
+        """
+        with self._lock:
+            return self._pending.get(user_id)
+
+    def flush(self):
+        """
+        Writes all buffered timestamps with one bulk UPDATE.
+        :return: int number of users written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        User = get_user_model()
+        users = [User(pk=user_id, last_request=timestamp)
+                 for user_id, timestamp in pending.items()]
+        try:
+            User.objects.bulk_update(users, ['last_request'])
+        except Exception:
+            logger.exception("Failed to flush last_request for %s users", len(users))
+            with self._lock:
+                for user_id, timestamp in pending.items():
+                    current = self._pending.get(user_id)
+                    if current is None or timestamp > current:
+                        self._pending[user_id] = timestamp
+            return 0
+        return len(users)
+
+
+last_seen = LastSeenTracker(
+    flush_interval=getattr(settings, 'LAST_SEEN_FLUSH_INTERVAL', 30),
+    flush_size=getattr(settings, 'LAST_SEEN_FLUSH_SIZE', 500),
+)
+atexit.register(last_seen.stop)
@@ -0,0 +1,179 @@
+import hashlib
+import math
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.checks import Tags, Warning, register
+from django.utils import timezone
+
+DAY_VERSION_KEY = 'analytics_day_version_{}'
+
+
+def day_version_keys(date_from, date_to):
+    """
+    Returns the version keys of every day in the range. Days after today
+    cannot have likes yet, so the range is cut at today.
+    :param date_from: date
+    :param date_to: date
+    :return: list of str
+    """
+    last = min(date_to, timezone.localdate())
+    return [DAY_VERSION_KEY.format(date_from + timezone.timedelta(days=offset))
+            for offset in range((last - date_from).days + 1)]
+
+
+def bump_day_versions(days):
+    """
+    Invalidates every cached analytics range that includes one of the days.
+    :param days: iterable of date
+    """
+    version = time.time_ns()
+    cache.set_many({DAY_VERSION_KEY.format(day): version for day in days},
+                   timeout=None)
+
+
+def range_cache_key(date_from, date_to, variant=''):
+    """
+    Builds the cache key of an analytics range from the versions of its days,
+    so a like on day D only misses ranges that include D.
+    :param date_from: date
+    :param date_to: date
+    :param variant: str, tells apart different data over the same range
+    :return: str
+    """
+    keys = day_version_keys(date_from, date_to)
+    return _versioned_key(date_from, date_to, variant, keys, cache.get_many(keys))
+
+
+async def arange_cache_key(date_from, date_to, variant=''):
+    """
+    Async counterpart of range_cache_key.
+    :param date_from: date
+    :param date_to: date
+    :param variant: str
+    :return: str
+    """
+    keys = day_version_keys(date_from, date_to)
+    return _versioned_key(date_from, date_to, variant, keys,
+                          await cache.aget_many(keys))
+
+
+def _versioned_key(date_from, date_to, variant, keys, versions):
+    digest = hashlib.md5(
+        '|'.join([variant] + [str(versions.get(key, 0)) for key in keys]).encode(),
+        usedforsecurity=False).hexdigest()
+    return f'analytics_{date_from}_{date_to}_{digest}'
+
+
+def range_timeout(date_to):
+    """
+    Closed historical ranges change only through version bumps and can be
+    kept for long, ranges including today are refreshed often.
+    :param date_to: date
+    :return: int seconds
+    """
+    if date_to < timezone.localdate():
+        return settings.ANALYTICS_CLOSED_RANGE_TIMEOUT
+    return settings.ANALYTICS_OPEN_RANGE_TIMEOUT
+
+
+@register(Tags.caches)
+def check_lease_cache(app_configs, **kwargs):
+    """
+    The recompute lease needs an add that is atomic across processes.
+    FileBasedCache reads then writes; api.cache.TieredCache in front of it
+    adds the lock that makes it atomic.
+    """
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], FileBasedCache):
+        return [Warning(
+            'The default cache is FileBasedCache, whose add() is not atomic, so '
+            'several processes can recompute the same analytics range at once.',
+            hint='Put api.cache.TieredCache in front of it, or use Redis.',
+            id='api.W001')]
+    return []
+
+
+def cached_range(date_from, date_to, compute, variant=''):
+    """
+    Returns the analytics of a range from the cache, computing it with
+    compute() when needed. Only one worker recomputes a range at a time,
+    the one whose cache.add() of the lease succeeds, so the default cache
+    must add atomically (see check_lease_cache): the others serve the
+    previous value of the range meanwhile, or wait briefly for the new one
+    on a cold miss. Entries are also refreshed
+    probabilistically before they expire (XFetch), earlier the longer the
+    computation took, so popular ranges rarely expire at all.
+    :param date_from: date
+    :param date_to: date
+    :param compute: callable returning the data
+    :param variant: str, tells apart different data over the same range
+    :return: tuple of the data and whether it came from the cache
+    """
+    cache_key = range_cache_key(date_from, date_to, variant)
+    stale_key = f'analytics_stale_{date_from}_{date_to}_{variant}'
+    entry = cache.get(cache_key)
+    if entry is not None and not _should_refresh(entry):
+        return entry['data'], True
+
+    lease_key = f'{cache_key}_lease'
+    if cache.add(lease_key, True, timeout=settings.ANALYTICS_LEASE_TIMEOUT):
+        try:
+            return _compute_entry(cache_key, stale_key, compute, date_to), False
+        finally:
+            cache.delete(lease_key)
+
+    if entry is None:
+        entry = cache.get(stale_key)
+    if entry is not None:
+        return entry['data'], True
+
+    deadline = time.monotonic() + settings.ANALYTICS_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry['data'], True
+    return compute(), False
+
+
+async def acached_range(date_from, date_to, compute, variant=''):
+    """
+    Async counterpart of cached_range. Fresh entries are served with async
+    cache reads only; a miss or a due refresh falls back to cached_range in
+    a worker thread, which takes care of the lease.
+    :param date_from: date
+    :param date_to: date
+    :param compute: callable returning the data, called in a worker thread
+    :param variant: str
+    :return: tuple of the data and whether it came from the cache
+    """
+    entry = await cache.aget(await arange_cache_key(date_from, date_to, variant))
+    if entry is not None and not _should_refresh(entry):
+        return entry['data'], True
+    return await sync_to_async(cached_range)(date_from, date_to, compute, variant)
+
+
+def _compute_entry(cache_key, stale_key, compute, date_to):
+    started = time.monotonic()
+    data = compute()
+    timeout = range_timeout(date_to)
+    entry = {
+        'data': data,
+        'delta': time.monotonic() - started,
+        'expires_at': time.time() + timeout,
+    }
+    # Entries outlive their logical expiry so they can be served stale
+    cache.set_many({cache_key: entry, stale_key: entry},
+                   timeout=timeout + settings.ANALYTICS_STALE_GRACE)
+    return data
+
+
+def _should_refresh(entry):
+    # 1 - random() lies in (0, 1], so the logarithm is defined
+    jitter = -math.log(1.0 - random.random())  # nosec B311
+    early = entry['delta'] * settings.ANALYTICS_EARLY_REFRESH_BETA * jitter
+    return time.time() + early >= entry['expires_at']
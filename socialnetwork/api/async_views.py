@@ -0,0 +1,136 @@
+"""
+Async versions of the read-heavy endpoints. Under ASGI they run on the
+event loop with the async ORM and async cache instead of occupying a
+thread for the whole request. They answer GET only: any other method on
+the same URL is handed to the DRF view they shadow, in a worker thread.
+
+DRF has no async views, so these authenticate, paginate and render with
+the same DRF components the sync views use. Responses are always JSON.
+"""
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.timezone import now
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .activity import last_seen
+from .analytics import acached_range
+from .authentication import CachedJWTAuthentication
+from .db import replica_reads
+from .models import Post
+from .serializers import PostSerializer
+from .views import (ANALYTICS_VARIANT, PostViewSet, UserViewSet,
+                    analytics_body, analytics_data, analytics_date_range)
+
+authentication = CachedJWTAuthentication()
+renderer = JSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(renderer.render(data), status=status_code, headers=headers,
+                        content_type=renderer.media_type)
+
+
+def error_response(exc):
+    """
+    Renders an APIException with DRF's exception handler, as the sync
+    views do.
+    """
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        exc.auth_header = authentication.authenticate_header(None)
+    response = exception_handler(exc, {})
+    headers = {name: value for name, value in response.items()
+               if name != 'Content-Type'}
+    return json_response(response.data, response.status_code, headers)
+
+
+async def authenticate(request):
+    """
+    Authenticates the request with the JWT and records the hit in the
+    last_seen buffer and as the user's last_request. Views call it before
+    any other read, so unauthenticated requests never reach the database
+    or the analytics lease.
+    :return: the user
+    :raises APIException: when the request is not authenticated
+    """
+    result = await authentication.aauthenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    user, _ = result
+    user.last_request = now()
+    await last_seen.atouch(user.pk, user.last_request)
+    return user
+
+
+def reads_only(fallback):
+    """
+    Serves GET with the decorated async view and every other method with
+    the sync fallback view.
+    """
+    def decorator(read_view):
+        @wraps(read_view)
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(fallback)(request, *args, **kwargs)
+            try:
+                return await read_view(request, *args, **kwargs)
+            except APIException as exc:
+                return error_response(exc)
+        return csrf_exempt(view)
+    return decorator
+
+
+@reads_only(UserViewSet.as_view({'get': 'activity'}))
+async def user_activity(request):
+    user = await authenticate(request)
+    return json_response({
+        'status': 'User activity retrieved successfully',
+        'last_login': user.last_login,
+        'last_request': user.last_request,
+    })
+
+
+@reads_only(PostViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def post_list(request):
+    request = Request(request)
+    view = PostViewSet(request=request, action='list', args=(), kwargs={},
+                       format_kwarg=None)
+    pagination = view.paginator
+
+    await authenticate(request)
+    with replica_reads():
+        posts = await pagination.apaginate_queryset(
+            view.filter_queryset(view.get_queryset()), request, view)
+    return json_response(pagination.get_paginated_response(
+        PostSerializer(posts, many=True).data).data)
+
+
+@reads_only(PostViewSet.as_view({'get': 'retrieve', 'put': 'update',
+                                 'patch': 'partial_update', 'delete': 'destroy'}))
+async def post_detail(request, pk):
+    await authenticate(request)
+    try:
+        instance = await Post.objects.aget(pk=pk)
+    except (Post.DoesNotExist, ValueError):
+        raise NotFound('No Post matches the given query.')
+    return json_response(PostSerializer(instance).data)
+
+
+@reads_only(PostViewSet.as_view({'get': 'analytics'}))
+async def post_analytics(request):
+    await authenticate(request)
+    try:
+        date_from, date_to = analytics_date_range(request.GET)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+    with replica_reads():
+        data, from_cache = await acached_range(
+            date_from, date_to, partial(analytics_data, date_from, date_to),
+            ANALYTICS_VARIANT)
+    return json_response(analytics_body(data, from_cache))
@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# The user fields the views read from request.user. Anything else is
+# deferred and loaded from the database on first access.
+SNAPSHOT_FIELDS = ('public_id', 'username', 'email', 'is_active', 'is_staff',
+                   'is_superuser', 'last_login', 'last_request')
+
+
+def snapshot_key(user_id):
+    return f'auth_user_{user_id}'
+
+
+def invalidate_user_snapshot(user_id):
+    """
+    Drops the cached snapshot of a user, so the next request reloads it.
+    Called on every save and delete of a user; updates that bypass the
+    model signals must call it themselves.
+    :param user_id: value of the token's user id claim
+    """
+    cache.delete(snapshot_key(user_id))
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with an async entry point for the async views. The
+    token is validated in the event loop and the user is loaded with the
+    async ORM, with the same checks as the sync path.
+    """
+
+    async def aauthenticate(self, request):
+        """
+        :param request: HttpRequest
+        :return: tuple of the user and the validated token, or None
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(
+                **{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            revoke_claim = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+            if revoke_claim != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class CachedJWTAuthentication(AsyncJWTAuthentication):
+    """
+    Resolves the token's user from a compact snapshot cached for
+    AUTH_USER_CACHE_TIMEOUT seconds instead of a SELECT per request, so
+    authentication and permission checks on warm requests run no SQL.
+
+    The user is rebuilt from the snapshot as a database instance with the
+    other fields deferred. Saving or deleting a user drops its snapshot,
+    so password changes and deactivation apply to the next request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Model.from_db expects the loaded values in field order
+        self.snapshot_fields = tuple(
+            field.attname for field in self.user_model._meta.concrete_fields
+            if field.attname in SNAPSHOT_FIELDS)
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        snapshot = cache.get(snapshot_key(user_id))
+        if snapshot is None:
+            snapshot = self.load_snapshot(user_id)
+            cache.set(snapshot_key(user_id), snapshot, settings.AUTH_USER_CACHE_TIMEOUT)
+        return self.check_user(snapshot, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        snapshot = await cache.aget(snapshot_key(user_id))
+        if snapshot is None:
+            snapshot = await self.aload_snapshot(user_id)
+            await cache.aset(snapshot_key(user_id), snapshot,
+                             settings.AUTH_USER_CACHE_TIMEOUT)
+        return self.check_user(snapshot, validated_token)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def snapshot_query(self, user_id):
+        return self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})\
+            .values_list(*self.snapshot_fields, 'password')
+
+    def load_snapshot(self, user_id):
+        """
+        :return: tuple of the snapshot_fields values followed by the
+            password fingerprint the revoke check compares tokens with
+        """
+        return self.make_snapshot(self.snapshot_query(user_id).first())
+
+    async def aload_snapshot(self, user_id):
+        return self.make_snapshot(await self.snapshot_query(user_id).afirst())
+
+    @staticmethod
+    def make_snapshot(row):
+        if row is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        *values, password = row
+        return (*values, get_md5_hash_password(password))
+
+    def check_user(self, snapshot, validated_token):
+        *values, password_fingerprint = snapshot
+        user = self.user_model.from_db(self.user_model.objects.db, self.snapshot_fields,
+                                       values)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            revoke_claim = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+            if revoke_claim != password_fingerprint:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,340 @@
+import fcntl
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+# Process-wide local tiers, keyed by LOCATION, so every thread shares one LRU
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+_MISSING = object()
+INVALIDATION_LOG_KEY = 'tiered_cache:invalidations'
+# Last log entry that changed a key of each prefix, see key_prefix
+PREFIX_LOG_KEY = INVALIDATION_LOG_KEY + ':prefix:{}'
+CLEAR_ALL = '*'
+# Not a .djcache file, so FileBasedCache never culls or clears it
+LOCK_FILE = 'tiered_cache.lock'
+
+
+def key_prefix(local_key):
+    """
+    Group of keys that are invalidated together when their log entries
+    are out of reach: the key up to its first underscore, such as the
+    auth or analytics keys.
+    :param local_key: str
+    :return: str
+    """
+    return local_key.partition('_')[0]
+
+
+class LocalTier:
+    """
+    Bounded in-process LRU holding pickled values with an expiry time. It is
+    limited both by number of entries and by the total size of the pickles.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.seen_seq = None
+        self.own_seqs = set()
+        self.last_sync = 0.0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.time():
+                self._pop(key)
+                return _MISSING
+            self._entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, pickled, timeout):
+        if timeout <= 0 or len(pickled) > self.max_bytes:
+            self.delete(key)
+            return
+        with self.lock:
+            self._pop(key)
+            self._entries[key] = (time.time() + timeout, pickled)
+            self._bytes += len(pickled)
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.stats['local_evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            return self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def prefixes(self):
+        with self.lock:
+            return {key_prefix(key) for key in self._entries}
+
+    def delete_prefixes(self, prefixes):
+        with self.lock:
+            for key in [key for key in self._entries if key_prefix(key) in prefixes]:
+                self._pop(key)
+
+    def size(self):
+        with self.lock:
+            return len(self._entries), self._bytes
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[1])
+        return True
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a bounded in-process LRU in front of a shared cache
+    configured under another alias (file, Redis or database backend).
+
+    Writes go to both tiers. Every set, delete and incr is also appended to
+    an invalidation log kept in the shared tier; each process replays the
+    log at most every SYNC_INTERVAL seconds and evicts the keys other
+    processes changed. add is not logged, as it only writes keys no process
+    holds. Local copies never outlive LOCAL_TIMEOUT seconds, which bounds
+    staleness if a log entry is lost.
+
+    A process reads at most LOG_WINDOW entries per sync, the latest ones.
+    When more were written since its last sync, or some have expired, it
+    also evicts the local keys of every prefix (see key_prefix) changed
+    since then, as recorded next to the log, and keeps the rest.
+
+    add and incr must be atomic in the shared tier: add takes the leases of
+    api.analytics, and incr numbers the log entries. They are on Redis. On
+    the database backend add is, but incr is a read then a write, so two
+    processes can number an entry alike and one invalidation is then only
+    applied after LOCAL_TIMEOUT. The file backend reads then writes for
+    both, so they run under an exclusive lock on a file in its directory,
+    which holds for all processes sharing that directory on one host.
+
+    OPTIONS:
+        SHARED_ALIAS: alias of the shared cache in CACHES (required)
+        MAX_ENTRIES: local tier entry limit (default 1000)
+        MAX_BYTES: local tier size limit in bytes (default 16 MiB)
+        LOCAL_TIMEOUT: longest time a value stays in the local tier (default 60)
+        SYNC_INTERVAL: seconds between invalidation log checks (default 1)
+        LOG_WINDOW: most log entries read per check (default 1024)
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self._shared_alias = options['SHARED_ALIAS']
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1)
+        self._log_window = options.get('LOG_WINDOW', 1024)
+        with _tiers_lock:
+            self._tier = _tiers.get(location)
+            if self._tier is None:
+                self._tier = _tiers[location] = LocalTier(
+                    options.get('MAX_ENTRIES', 1000),
+                    options.get('MAX_BYTES', 16 * 1024 * 1024))
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        value = self._tier.get(local_key)
+        if value is not _MISSING:
+            self._tier.stats['local_hits'] += 1
+            return value
+        self._tier.stats['local_misses'] += 1
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._tier.stats['shared_misses'] += 1
+            return default
+        self._tier.stats['shared_hits'] += 1
+        self._set_local(local_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    async def aget(self, key, default=None, version=None):
+        """
+        Serves local tier hits without leaving the event loop. Misses, and
+        invalidation log checks when due, run in a worker thread that is not
+        tied to the request, so they can overlap with its database queries.
+        """
+        if time.monotonic() - self._tier.last_sync < self._sync_interval:
+            value = self._tier.get(self.make_and_validate_key(key, version=version))
+            if value is not _MISSING:
+                self._tier.stats['local_hits'] += 1
+                return value
+        return await sync_to_async(self.get, thread_sensitive=False)(
+            key, default, version)
+
+    async def aget_many(self, keys, version=None):
+        found, missing = {}, list(keys)
+        if time.monotonic() - self._tier.last_sync < self._sync_interval:
+            missing = []
+            for key in keys:
+                value = self._tier.get(self.make_and_validate_key(key, version=version))
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    found[key] = value
+            self._tier.stats['local_hits'] += len(found)
+        if missing:
+            found.update(await sync_to_async(self.get_many, thread_sensitive=False)(
+                missing, version))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        self._set_local(local_key, value, timeout)
+        self._publish(local_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        with self._shared_lock():
+            if not self.shared.add(key, value, timeout, version=version):
+                return False
+        self._set_local(local_key, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._tier.delete(local_key)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._tier.delete(local_key)
+        deleted = self.shared.delete(key, version=version)
+        self._publish(local_key)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        with self._shared_lock():
+            value = self.shared.incr(key, delta, version=version)
+        self._tier.delete(local_key)
+        self._publish(local_key)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._tier.clear()
+        self.shared.clear()
+        self._publish(CLEAR_ALL)
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        """
+        Returns hit/miss counters for both tiers and the local tier size.
+        :return: dict
+        """
+        entries, size = self._tier.size()
+        stats = {name: self._tier.stats[name] for name in (
+            'local_hits', 'local_misses', 'shared_hits', 'shared_misses',
+            'local_evictions', 'log_overflows')}
+        stats.update(local_entries=entries, local_bytes=size)
+        return stats
+
+    def _set_local(self, local_key, value, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            timeout = self._local_timeout
+        else:
+            timeout = min(timeout - time.time(), self._local_timeout)
+        self._tier.set(local_key, pickle.dumps(value, self.pickle_protocol), timeout)
+
+    @contextmanager
+    def _shared_lock(self):
+        shared = self.shared
+        if not isinstance(shared, FileBasedCache):
+            yield
+            return
+        os.makedirs(shared._dir, exist_ok=True)
+        with open(os.path.join(shared._dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _publish(self, local_key):
+        shared = self.shared
+        with self._shared_lock():
+            try:
+                seq = shared.incr(INVALIDATION_LOG_KEY)
+            except ValueError:
+                # First entry, or the counter was evicted
+                shared.add(INVALIDATION_LOG_KEY, 0, None)
+                seq = shared.incr(INVALIDATION_LOG_KEY)
+        shared.set(f'{INVALIDATION_LOG_KEY}:{seq}', local_key, self._local_timeout)
+        shared.set(PREFIX_LOG_KEY.format(key_prefix(local_key)), seq, None)
+        with self._tier.lock:
+            self._tier.own_seqs.add(seq)
+
+    def _sync(self):
+        tier = self._tier
+        now = time.monotonic()
+        if now - tier.last_sync < self._sync_interval:
+            return
+        tier.last_sync = now
+        seq = self.shared.get(INVALIDATION_LOG_KEY, 0)
+        seen = tier.seen_seq
+        tier.seen_seq = seq
+        if seen is None or seq == seen:
+            return
+        with tier.lock:
+            own_seqs = {s for s in tier.own_seqs if s <= seq}
+            tier.own_seqs -= own_seqs
+        if seq < seen:
+            # The counter was lost, so was the rest of the shared tier
+            tier.clear()
+            return
+        first = max(seen + 1, seq - self._log_window + 1)
+        log_keys = [f'{INVALIDATION_LOG_KEY}:{s}'
+                    for s in range(first, seq + 1) if s not in own_seqs]
+        entries = self.shared.get_many(log_keys)
+        if CLEAR_ALL in entries.values():
+            tier.clear()
+            return
+        for local_key in entries.values():
+            tier.delete(local_key)
+        if first > seen + 1 or len(entries) < len(log_keys):
+            tier.stats['log_overflows'] += 1
+            self._evict_changed_prefixes(seen)
+
+    def _evict_changed_prefixes(self, seen):
+        prefix_keys = {PREFIX_LOG_KEY.format(prefix): prefix
+                       for prefix in self._tier.prefixes()}
+        if not prefix_keys:
+            return
+        seqs = self.shared.get_many(list(prefix_keys))
+        # A prefix without a recorded entry may have lost it, so it counts
+        # as changed
+        self._tier.delete_prefixes({prefix for key, prefix in prefix_keys.items()
+                                    if seqs.get(key, seen + 1) > seen})
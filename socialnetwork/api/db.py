@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+REPLICA = 'replica'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Routes the reads made inside the block to the replica database when one
+    is configured. Writes still go to the primary.
+    """
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside replica_reads() to the replica, unless a
+    transaction is open on the primary, and everything else to the primary.
+    Both hold the same data, so relations between objects read from either
+    are allowed.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Inside a transaction on the primary, reads stay there so they see
+        # its uncommitted writes
+        if (_read_from_replica.get()
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so objects read from the replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,176 @@
+"""
+Streaming exports of the raw likes and of the per-post daily like rollup.
+
+Rows are read as tuples in primary key order, chunk_size at a time (with
+a server-side cursor on PostgreSQL), and encoded a chunk at a time, so
+memory stays flat however many rows match. Every row carries its id:
+passing the last id received as the cursor resumes an interrupted export
+right after that row.
+"""
+import csv
+import io
+from datetime import datetime, time, timedelta
+from itertools import batched
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .models import DailyLikeStats, Like
+from .params import date_param, int_param
+
+
+class NDJSONFormat:
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def header(self):
+        return ''
+
+    def encode(self, rows):
+        encode, columns = self.encoder.encode, self.columns
+        return ''.join([encode(dict(zip(columns, row))) + '\n' for row in rows])
+
+
+class CSVFormat:
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self):
+        return self.encode([self.columns])
+
+    def encode(self, rows):
+        self.writer.writerows(rows)
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return value
+
+
+FORMATS = {'ndjson': NDJSONFormat, 'csv': CSVFormat}
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Selects the NDJSON export with ?format=ndjson or the Accept header.
+    Renders error responses as a single JSON line.
+    """
+    media_type = NDJSONFormat.content_type
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Selects the CSV export with ?format=csv or the Accept header. Renders
+    error responses as field,message rows.
+    """
+    media_type = CSVFormat.content_type
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        export_format = CSVFormat(('field', 'message'))
+        return (export_format.header() + export_format.encode(
+            (field, message) for field, messages in data.items()
+            for message in (messages if isinstance(messages, list) else [messages])
+        )).encode(self.charset)
+
+
+def export_params(query_params):
+    """
+    Reads the export filters and cursor from the query string. All of them
+    are optional; dates are inclusive. The format is negotiated by the
+    export renderers.
+    :return: dict with date_from, date_to, post, user and cursor
+    :raises ValidationError: for invalid values
+    """
+    return {
+        'date_from': date_param(query_params, 'date_from'),
+        'date_to': date_param(query_params, 'date_to'),
+        'post': int_param(query_params, 'post'),
+        'user': int_param(query_params, 'user'),
+        'cursor': int_param(query_params, 'cursor'),
+    }
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def like_rows(params):
+    """
+    :return: tuple of the column names and the queryset of Like rows
+    """
+    queryset = Like.objects.all()
+    if params['date_from']:
+        queryset = queryset.filter(date__gte=_day_start(params['date_from']))
+    if params['date_to']:
+        queryset = queryset.filter(
+            date__lt=_day_start(params['date_to'] + timedelta(days=1)))
+    if params['post'] is not None:
+        queryset = queryset.filter(post_id=params['post'])
+    if params['user'] is not None:
+        queryset = queryset.filter(user_id=params['user'])
+    if params['cursor'] is not None:
+        queryset = queryset.filter(public_id__gt=params['cursor'])
+    return (('id', 'post_id', 'user_id', 'date'),
+            queryset.order_by('public_id')
+            .values_list('public_id', 'post_id', 'user_id', 'date'))
+
+
+def analytics_rows(params):
+    """
+    :return: tuple of the column names and the queryset of the per-post
+        DailyLikeStats rows
+    """
+    queryset = DailyLikeStats.objects.filter(post__isnull=False, count__gt=0)
+    if params['date_from']:
+        queryset = queryset.filter(day__gte=params['date_from'])
+    if params['date_to']:
+        queryset = queryset.filter(day__lte=params['date_to'])
+    if params['post'] is not None:
+        queryset = queryset.filter(post_id=params['post'])
+    if params['user'] is not None:
+        queryset = queryset.filter(post__user_id=params['user'])
+    if params['cursor'] is not None:
+        queryset = queryset.filter(id__gt=params['cursor'])
+    return (('id', 'date', 'post_id', 'count'),
+            queryset.order_by('id').values_list('id', 'day', 'post_id', 'count'))
+
+
+def stream(export_format, queryset, chunk_size):
+    """
+    :return: iterator of encoded chunks of chunk_size rows
+    """
+    header = export_format.header()
+    if header:
+        yield header
+    for rows in batched(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield export_format.encode(rows)
+
+
+async def astream(export_format, queryset, chunk_size):
+    """
+    Async counterpart of stream, for ASGI servers, which would otherwise
+    read the whole sync iterator into memory before sending it. Each chunk
+    is produced by stream in the same worker thread, which owns the
+    database cursor.
+    """
+    chunks = stream(export_format, queryset, chunk_size)
+    while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+        yield chunk
@@ -0,0 +1,242 @@
+"""
+Home timelines. Every user has a precomputed timeline of up to
+FEED_TIMELINE_SIZE post ids from the authors they follow, so reading the
+feed is an index range scan instead of a JOIN over every followed author.
+
+New posts are fanned out to the timelines of their author's followers in
+a background thread, in batches, so creating a post costs the same however
+many followers its author has. Authors with FEED_FANOUT_THRESHOLD followers
+or more are skipped by fan-out; their posts are fanned in when the feed is
+read instead.
+"""
+import atexit
+import base64
+import logging
+import queue
+import random
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+
+from .models import Follow, Post, TimelineEntry
+
+logger = logging.getLogger('api')
+
+
+def fan_out(post_id):
+    """
+    Adds the post to the timelines of its author's followers, walking them
+    FEED_FANOUT_BATCH_SIZE at a time. Posts of authors that are fanned in
+    on read are skipped.
+    :param post_id: int
+    """
+    post = Post.objects.filter(pk=post_id)\
+        .values('user_id', 'user__follower_count', 'pub_date').first()
+    if post is None or post['user__follower_count'] >= settings.FEED_FANOUT_THRESHOLD:
+        return
+    followers = Follow.objects.filter(followee_id=post['user_id']).order_by('follower_id')
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    last_follower = 0
+    while True:
+        batch = list(followers.filter(follower_id__gt=last_follower)
+                     .values_list('follower_id', flat=True)[:batch_size])
+        if not batch:
+            return
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(user_id=follower_id, post_id=post_id,
+                               pub_date=post['pub_date']) for follower_id in batch],
+                ignore_conflicts=True)
+        # Trimming a timeline reads all of it, so each one is trimmed on
+        # average once per FEED_TRIM_INTERVAL posts it receives
+        trim_timelines([follower_id for follower_id in batch
+                        if random.random() * settings.FEED_TRIM_INTERVAL < 1])
+        last_follower = batch[-1]
+
+
+def trim_timelines(user_ids):
+    """
+    Drops the entries past FEED_TIMELINE_SIZE from the users' timelines.
+    :param user_ids: iterable of int
+    """
+    size = settings.FEED_TIMELINE_SIZE
+    for user_id in user_ids:
+        timeline = TimelineEntry.objects.filter(user_id=user_id)
+        last = timeline.order_by('-pub_date', '-post_id')\
+            .values_list('pub_date', 'post_id')[size:size + 1].first()
+        if last is not None:
+            pub_date, post_id = last
+            timeline.filter(_before(last, 'post_id')
+                            | Q(pub_date=pub_date, post_id=post_id)).delete()
+
+
+def follow(user, followee):
+    """
+    Follows followee and copies their latest posts into the user's
+    timeline, unless they are fanned in on read.
+    :param user: ApiUser
+    :param followee: ApiUser
+    :return: bool, False when already following
+    """
+    if not Follow.objects.add(user, followee):
+        return False
+    if followee.follower_count + 1 < settings.FEED_FANOUT_THRESHOLD:
+        posts = Post.objects.filter(user=followee).order_by('-pub_date', '-id')\
+            .values_list('id', 'pub_date')[:settings.FEED_TIMELINE_SIZE]
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+             for post_id, pub_date in posts], ignore_conflicts=True)
+        trim_timelines([user.pk])
+    return True
+
+
+def rebuild_timeline(user_id):
+    """
+    Refills the user's timeline from the latest posts of the followed
+    authors that are fanned out.
+    :param user_id: int
+    :return: int, number of entries
+    """
+    posts = Post.objects.filter(
+        user__followers__follower_id=user_id,
+        user__follower_count__lt=settings.FEED_FANOUT_THRESHOLD)\
+        .order_by('-pub_date', '-id')\
+        .values_list('id', 'pub_date')[:settings.FEED_TIMELINE_SIZE]
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        return len(TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+             for post_id, pub_date in posts]))
+
+
+def unfollow(user, followee):
+    """
+    Unfollows followee and removes their posts from the user's timeline.
+    :param user: ApiUser
+    :param followee: ApiUser
+    :return: bool, False when not following
+    """
+    if not Follow.objects.remove(user, followee):
+        return False
+    TimelineEntry.objects.filter(user=user, post__user=followee).delete()
+    return True
+
+
+def _before(position, id_field):
+    pub_date, post_id = position
+    return Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, **{f'{id_field}__lt': post_id})
+
+
+def feed_page(user, position, size):
+    """
+    Merges the user's timeline with the latest posts of the followed
+    authors that are fanned in on read.
+    :param user: ApiUser
+    :param position: tuple of pub_date and id of the last post already
+        seen, or None for the first page
+    :param size: int
+    :return: list of up to size + 1 posts, newest first
+    """
+    timeline = TimelineEntry.objects.filter(user=user)
+    if position is not None:
+        timeline = timeline.filter(_before(position, 'post_id'))
+    post_ids = list(timeline.order_by('-pub_date', '-post_id')
+                    .values_list('post_id', flat=True)[:size + 1])
+
+    authors = list(Follow.objects.filter(
+        follower=user, followee__follower_count__gte=settings.FEED_FANOUT_THRESHOLD)
+        .values_list('followee_id', flat=True))
+    if authors:
+        fanned_in = Post.objects.filter(user_id__in=authors)
+        if position is not None:
+            fanned_in = fanned_in.filter(_before(position, 'id'))
+        post_ids += fanned_in.order_by('-pub_date', '-id')\
+            .values_list('id', flat=True)[:size + 1]
+    if not post_ids:
+        return []
+    return list(Post.objects.filter(id__in=post_ids)
+                .order_by('-pub_date', '-id')[:size + 1])
+
+
+def encode_cursor(post):
+    position = f'{post.pub_date.isoformat()}|{post.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: str or None
+    :return: tuple of pub_date and post id, or None
+    :raises NotFound: for a malformed cursor, as DRF's cursor pagination does
+    """
+    if not cursor:
+        return None
+    try:
+        pub_date, post_id = base64.urlsafe_b64decode(cursor.encode())\
+            .decode().split('|')
+        return datetime.fromisoformat(pub_date), int(post_id)
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+class FanoutWorker:
+    """
+    Fans out new posts in a background thread. Posts submitted while the
+    thread is busy wait in an in-memory queue, which is drained at exit.
+    With FEED_FANOUT_BACKGROUND off, posts are fanned out by the caller.
+
+    Queued posts are lost if the process dies; rebuild_timelines restores
+    the timelines from the follow graph.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, post_id):
+        """
+        :param post_id: int, of a committed post
+        """
+        if not settings.FEED_FANOUT_BACKGROUND:
+            fan_out(post_id)
+            return
+        self._queue.put(post_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='fanout',
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def join(self):
+        """
+        Waits until every submitted post has been fanned out.
+        """
+        self._queue.join()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while (post_id := self._queue.get()) is not None:
+            try:
+                fan_out(post_id)
+            except Exception:
+                logger.exception("Fan-out failed for post: %s", post_id)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+        self._queue.task_done()
+
+
+fanout = FanoutWorker()
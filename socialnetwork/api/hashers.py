@@ -0,0 +1,142 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """
+    Argon2id with the costs from the PASSWORD_ARGON2_* settings. Hashes made
+    with other costs are upgraded on the next successful login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    Scrypt with the costs from the PASSWORD_SCRYPT_* settings. Hashes made
+    with other costs are upgraded on the next successful login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # Scrypt needs about 128 * n * r bytes. OpenSSL refuses anything over
+        # 32 MiB unless told otherwise, so allow twice what the costs need.
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with PASSWORD_PBKDF2_ITERATIONS iterations.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+def _setup_worker():
+    django.setup()
+
+
+def _check_password(password, encoded):
+    must_update = []
+    valid = hashers.check_password(password, encoded,
+                                   setter=lambda raw: must_update.append(True))
+    return valid, bool(must_update)
+
+
+class HashingPool:
+    """
+    Runs password hashing in a bounded pool of worker processes, so the
+    CPU-heavy key derivation neither holds the GIL of a request worker nor
+    uses more than workers cores. At most twice as many hashes as there
+    are workers are in flight; further callers wait for a slot. With no
+    workers everything runs inline on the calling thread.
+
+    The workers are started on first use and load the settings module
+    themselves, so settings overridden at runtime do not reach them.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(2 * workers) if workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def run(self, func, *args):
+        """
+        :param func: picklable module-level function
+        :return: the result of func(*args)
+        """
+        if not self.workers:
+            return func(*args)
+        with self._slots:
+            return self._get_executor().submit(func, *args).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver, because forking a process that runs the log
+                # listener and server threads can deadlock the child
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_setup_worker)
+                atexit.register(self.shutdown)
+            return self._executor
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASHING_WORKERS)
+
+
+def make_password(password):
+    """
+    Hashes the password with the preferred hasher, on the hashing pool.
+    :param password: str
+    :return: str
+    """
+    return hashing_pool.run(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    """
+    Checks the password against the hash, on the hashing pool.
+    :param password: str
+    :param encoded: str
+    :return: tuple of whether the password matches and whether the hash
+        should be rehashed with the preferred hasher and costs
+    """
+    return hashing_pool.run(_check_password, password, encoded)
@@ -0,0 +1,186 @@
+"""
+Approximate counts of the distinct users who liked something, per day and
+over any range of days, from HyperLogLog sketches.
+
+Every day has a sketch of REGISTERS registers. A like sets the register
+picked by the first PRECISION bits of the hash of the user id to the rank
+of the rest of the hash, the position of its first 1 bit, if that is
+higher. A day's registers are packed one byte each into the registers
+column of its DailyLikeStats total row, 16 KiB however many likes it has,
+and raised by the same UPDATE that adds the likes to the day total. The
+sketch of a range is the byte-wise maximum of its days.
+
+Estimates have a relative standard error of STANDARD_ERROR, 0.81%: about
+two thirds are within 0.81% of the exact count and nearly all within 2.4%.
+Small counts use linear counting and are almost exact. A user who unlikes
+everything they liked that day is still counted.
+"""
+import math
+
+import numpy as np
+from django.apps import apps
+from django.db import transaction
+from django.db.models import BinaryField, Func
+from django.db.models.functions import TruncDate
+
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTERS)
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+_MASK = (1 << 64) - 1
+
+
+def user_hash(user_id):
+    """
+    SplitMix64 finalizer, which spreads consecutive ids over all 64 bits.
+    :param user_id: int
+    :return: int
+    """
+    value = (user_id + 0x9E3779B97F4A7C15) & _MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+
+def register_of(user_id):
+    """
+    :param user_id: int
+    :return: tuple of the register the user sets and the rank set in it
+    """
+    value = user_hash(user_id)
+    rest = value & ((1 << (64 - PRECISION)) - 1)
+    return value >> (64 - PRECISION), 64 - PRECISION - rest.bit_length() + 1
+
+
+class RaiseRegister(Func):
+    """
+    The packed registers of a column with the register of one user raised
+    to its rank, for use in an UPDATE so concurrent likes cannot undo each
+    other. An empty column counts as all zeros.
+    """
+    output_field = BinaryField()
+
+    def __init__(self, expression, user_id):
+        super().__init__(expression)
+        self.register, self.rank = register_of(user_id)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        registers = f'COALESCE({column}, zeroblob({REGISTERS}))'
+        rank = bytes([self.rank])
+        # Ranks are below 0x80, so the bytes survive the text concatenation
+        sql = (f'CASE WHEN substr({registers}, {self.register + 1}, 1) < %s '
+               f'THEN CAST(substr({registers}, 1, {self.register}) || %s '
+               f'|| substr({registers}, {self.register + 2}) AS BLOB) '
+               f'ELSE {column} END')
+        return sql, (*params, rank, *params, rank, *params, *params)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        registers = f"COALESCE({column}, decode(repeat('00', {REGISTERS}), 'hex'))"
+        sql = (f'set_byte({registers}, {self.register}, '
+               f'GREATEST(get_byte({registers}, {self.register}), %s))')
+        return sql, (*params, *params, self.rank)
+
+
+def unpack(registers):
+    """
+    :param registers: bytes or memoryview from the registers column, or None
+    :return: numpy array of REGISTERS ranks
+    """
+    if registers is None:
+        return np.zeros(REGISTERS, dtype=np.uint8)
+    return np.frombuffer(registers, dtype=np.uint8)
+
+
+def merge(sketches):
+    """
+    :param sketches: iterable of numpy arrays of ranks
+    :return: numpy array of ranks, the sketch of their union
+    """
+    merged = np.zeros(REGISTERS, dtype=np.uint8)
+    for sketch in sketches:
+        np.maximum(merged, sketch, out=merged)
+    return merged
+
+
+def estimate(ranks):
+    """
+    :param ranks: numpy array of REGISTERS ranks
+    :return: int, estimated number of distinct users
+    """
+    zeros = REGISTERS - int(np.count_nonzero(ranks))
+    raw = _ALPHA * REGISTERS ** 2 / float(np.exp2(-ranks.astype(np.float64)).sum())
+    if raw <= 2.5 * REGISTERS and zeros:
+        return round(REGISTERS * math.log(REGISTERS / zeros))
+    return round(raw)
+
+
+def daily_sketches(date_from, date_to):
+    """
+    :param date_from: date
+    :param date_to: date, inclusive
+    :return: dict of day to numpy array of ranks, for days with a sketch
+    """
+    rows = _totals().filter(day__range=[date_from, date_to], registers__isnull=False)\
+        .values_list('day', 'registers')
+    return {day: unpack(registers) for day, registers in rows}
+
+
+def daily_unique_users(date_from, date_to):
+    """
+    :param date_from: date
+    :param date_to: date, inclusive
+    :return: dict of day to estimated number of users who liked something
+    """
+    return {day: estimate(sketch)
+            for day, sketch in daily_sketches(date_from, date_to).items()}
+
+
+def unique_users(date_from, date_to):
+    """
+    :param date_from: date
+    :param date_to: date, inclusive
+    :return: int, estimated number of users who liked something in the range
+    """
+    return estimate(merge(daily_sketches(date_from, date_to).values()))
+
+
+def rebuild(date_from=None, date_to=None, batch_size=5000):
+    """
+    Recomputes the daily sketches from the likes, for example after a bulk
+    import that bypassed the like signals. Users who since unliked
+    everything of a day are no longer counted.
+    :param date_from: date, first day to rebuild, all days by default
+    :param date_to: date, last day to rebuild, all days by default
+    :param batch_size: int
+    :return: int, number of days rebuilt
+    """
+    Stats = apps.get_model('api', 'DailyLikeStats')
+    likes = apps.get_model('api', 'Like').objects.annotate(day=TruncDate('date'))
+    totals = _totals()
+    if date_from:
+        likes = likes.filter(day__gte=date_from)
+        totals = totals.filter(day__gte=date_from)
+    if date_to:
+        likes = likes.filter(day__lte=date_to)
+        totals = totals.filter(day__lte=date_to)
+    sketches = {}
+    for day, user_id in likes.order_by().values_list('day', 'user_id').distinct()\
+            .iterator(chunk_size=batch_size):
+        if day not in sketches:
+            sketches[day] = np.zeros(REGISTERS, dtype=np.uint8)
+        register, rank = register_of(user_id)
+        if rank > sketches[day][register]:
+            sketches[day][register] = rank
+    with transaction.atomic():
+        totals.update(registers=None)
+        Stats.objects.bulk_create([Stats(day=day, post=None) for day in sketches],
+                                  ignore_conflicts=True, batch_size=batch_size)
+        for day, sketch in sketches.items():
+            _totals().filter(day=day).update(registers=sketch.tobytes())
+    return len(sketches)
+
+
+def _totals():
+    return apps.get_model('api', 'DailyLikeStats').objects.filter(post__isnull=True)
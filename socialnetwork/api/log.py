@@ -0,0 +1,68 @@
+import atexit
+import json
+import logging
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueListener
+
+# Pass as extra= on high-volume INFO events so SampleFilter can drop most of them
+SAMPLED = {'sampled': True}
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class BackgroundListener(QueueListener):
+    """
+    QueueListener that starts its thread as soon as dictConfig builds it and
+    drains the queue at exit, so handlers writing to files or the console
+    never run on the request thread.
+
+    Use as the listener of a logging.handlers.QueueHandler in LOGGING.
+    """
+
+    def __init__(self, queue, *handlers, respect_handler_level=False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records logged with extra=SAMPLED at INFO
+    level or below. Warnings and errors are always kept.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or record.levelno > logging.INFO:
+            return True
+        return random.random() < self.rate  # nosec B311
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line, including the values
+    passed with extra=.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES and key != 'sampled')
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
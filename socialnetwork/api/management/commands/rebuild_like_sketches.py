@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.hyperloglog import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the daily sketches of the users who liked something, '
+            'without touching the like counts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='First day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Last day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            date_from = self._parse_date(options['date_from'])
+            date_to = self._parse_date(options['date_to'])
+        except ValueError:
+            raise CommandError('Invalid date format. Use YYYY-MM-DD.')
+        days = rebuild(date_from, date_to, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the user sketches of {days} days'))
+
+    @staticmethod
+    def _parse_date(value):
+        if not value:
+            return None
+        return timezone.datetime.strptime(value, '%Y-%m-%d').date()
@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.analytics import bump_day_versions
+from api.hyperloglog import rebuild as rebuild_sketches
+from api.models import DailyLikeStats, Like
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds or backfills the DailyLikeStats rollup and its user sketches '
+            'from the Like table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='First day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Last day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            date_from = self._parse_date(options['date_from'])
+            date_to = self._parse_date(options['date_to'])
+        except ValueError:
+            raise CommandError('Invalid date format. Use YYYY-MM-DD.')
+        batch_size = options['batch_size']
+
+        likes = Like.objects.annotate(day=TruncDate('date'))
+        stats = DailyLikeStats.objects.all()
+        if date_from:
+            likes = likes.filter(day__gte=date_from)
+            stats = stats.filter(day__gte=date_from)
+        if date_to:
+            likes = likes.filter(day__lte=date_to)
+            stats = stats.filter(day__lte=date_to)
+        rows = likes.order_by().values('day', 'post_id')\
+            .annotate(count=Count('public_id'))\
+            .values_list('day', 'post_id', 'count')
+
+        totals = Counter()
+        batch = []
+        created = 0
+        with transaction.atomic():
+            stale_days = set(stats.values_list('day', flat=True).distinct())
+            stats.delete()
+            for day, post_id, count in rows.iterator(chunk_size=batch_size):
+                totals[day] += count
+                batch.append(DailyLikeStats(day=day, post_id=post_id, count=count))
+                if len(batch) >= batch_size:
+                    DailyLikeStats.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            batch.extend(DailyLikeStats(day=day, post=None, count=count)
+                         for day, count in totals.items())
+            DailyLikeStats.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            rebuild_sketches(date_from, date_to, batch_size)
+        bump_day_versions(stale_days | set(totals))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {created} rollup rows for {len(totals)} days'))
+
+    @staticmethod
+    def _parse_date(value):
+        if not value:
+            return None
+        return timezone.datetime.strptime(value, '%Y-%m-%d').date()
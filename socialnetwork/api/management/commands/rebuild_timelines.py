@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.feed import rebuild_timeline
+from api.models import ApiUser
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the home timelines from the follow graph, one user at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild the timeline of this user id')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = ApiUser.objects.order_by('public_id')
+        if options['users']:
+            users = users.filter(public_id__in=options['users'])
+        rebuilt = entries = 0
+        for user_id in users.values_list('public_id', flat=True)\
+                .iterator(chunk_size=options['batch_size']):
+            entries += rebuild_timeline(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rebuilt} timelines with {entries} entries'))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.trending import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the trending scores of the posts from their recent likes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Only count the likes of the last days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        scored = rebuild(since, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the trending scores of {scored} posts'))
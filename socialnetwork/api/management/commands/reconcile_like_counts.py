@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Like, Post
+
+
+class Command(BaseCommand):
+    help = 'Fixes drift between Post.like_count and the Like table in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        actual_count = Subquery(
+            Like.objects.filter(post=OuterRef('pk'))
+            .order_by().values('post')
+            .annotate(count=Count('public_id')).values('count'),
+            output_field=IntegerField())
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            ids = list(Post.objects.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+            drifted = list(Post.objects.filter(id__in=ids)
+                           .annotate(actual=Count('likes'))
+                           .filter(~Q(like_count=F('actual')))
+                           .values_list('id', flat=True))
+            if drifted:
+                # Recount inside the UPDATE so likes made meanwhile are included
+                fixed += Post.objects.filter(id__in=drifted)\
+                    .update(like_count=Coalesce(actual_count, 0))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} posts, fixed {fixed} like counts'))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.seeding import seed
+
+
+class Command(BaseCommand):
+    help = 'Bulk generates users, posts and likes for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--likes', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=30,
+                            help='Spread post and like dates over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed, the same seed yields the same data')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes for posts and likes')
+        parser.add_argument('--prefix', default='seed',
+                            help='Username prefix of the seeded users')
+        parser.add_argument('--password', default='Seeded123',
+                            help='Password shared by all seeded users')
+        parser.add_argument('--skip-counters', action='store_true',
+                            help='Do not rebuild like_count, the daily rollup, '
+                                 'the trending scores and the user sketches')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        user_ids, post_ids = seed(
+            options['users'], options['posts'], options['likes'],
+            days=options['days'], batch_size=options['batch_size'],
+            seed=options['seed'], workers=options['workers'],
+            prefix=options['prefix'], password=options['password'])
+        self.stdout.write(
+            f'Seeded {len(user_ids)} users and {len(post_ids)} posts '
+            f'in {time.monotonic() - started:.1f}s')
+
+        if not options['skip_counters']:
+            call_command('rebuild_like_stats', stdout=self.stdout)
+            call_command('reconcile_like_counts', stdout=self.stdout)
+            call_command('rebuild_trending', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.monotonic() - started:.1f}s'))
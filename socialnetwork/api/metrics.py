@@ -0,0 +1,144 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from rest_framework.serializers import BaseSerializer
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# One-item list holding the serializer time of the request being profiled,
+# None when it is not sampled. The list is mutated in place so time spent in
+# threads running the view is seen by the middleware.
+serializer_seconds = contextvars.ContextVar('serializer_seconds', default=None)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set, rendered in the Prometheus
+    text format.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0, 0])
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series[labels]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(labels, le=bound)} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(labels)} {value}')
+        return lines
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + [(key, value) for key, value in extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"'
+                          for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+REQUESTS = Counter('api_requests_total', 'Profiled requests by view, action and status')
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Wall time of profiled requests', DURATION_BUCKETS)
+SQL_QUERIES = Histogram(
+    'api_request_sql_queries', 'SQL queries per profiled request', QUERY_BUCKETS)
+SQL_DURATION = Histogram(
+    'api_request_sql_duration_seconds', 'SQL time per profiled request',
+    DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram(
+    'api_request_serializer_duration_seconds', 'Serializer time per profiled request',
+    DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes', 'Response body size of profiled requests', SIZE_BUCKETS)
+
+METRICS = (REQUESTS, REQUEST_DURATION, SQL_QUERIES, SQL_DURATION,
+           SERIALIZER_DURATION, RESPONSE_SIZE)
+
+
+def render_metrics(extra_lines=()):
+    """
+    Renders every metric in the Prometheus text exposition format.
+    :return: str
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
+
+
+_instrumented = False
+
+
+def instrument_serializers():
+    """
+    Wraps BaseSerializer.data so the time spent building serializer output
+    is added to the request being profiled. Serializer.data and
+    ListSerializer.data both end up in BaseSerializer.data, and nested
+    serializers go through to_representation, so nothing is counted twice.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    data = BaseSerializer.data
+
+    def timed_data(self):
+        elapsed = serializer_seconds.get()
+        if elapsed is None:
+            return data.fget(self)
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            elapsed[0] += time.perf_counter() - started
+
+    BaseSerializer.data = property(timed_data)
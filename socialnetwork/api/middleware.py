@@ -0,0 +1,165 @@
+import contextvars
+import cProfile
+import logging
+import random
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import (REQUEST_DURATION, REQUESTS, RESPONSE_SIZE,
+                      SERIALIZER_DURATION, SQL_DURATION, SQL_QUERIES,
+                      instrument_serializers, serializer_seconds)
+
+logger = logging.getLogger('api')
+
+
+class QueryTimer:
+    """
+    Execute wrapper callable counting queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+# QueryTimer of the request being profiled, None when it is not sampled
+query_timer = contextvars.ContextVar('query_timer', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed once on every connection. It times the query
+    when the current request is profiled, which also works for async
+    requests whose queries run in another thread, and costs nothing else.
+    """
+    timer = query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class ProfilingMiddleware:
+    """
+    Records wall time, SQL query count and time, serializer time and response
+    size of a sample of requests, labelled by view and action, into the
+    histograms served by the metrics endpoint. Sampled requests slower than
+    PROFILING_CPROFILE_THRESHOLD_MS can also be dumped as cProfile stats.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.cprofile_threshold = getattr(
+            settings, 'PROFILING_CPROFILE_THRESHOLD_MS', None)
+        self.cprofile_dir = Path(getattr(
+            settings, 'PROFILING_CPROFILE_DIR', settings.BASE_DIR / 'logs' / 'profiles'))
+        # Serializer timing patches BaseSerializer.data for the whole process
+        if self.sample_rate > 0:
+            instrument_serializers()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        elapsed = [0.0]
+        tokens = query_timer.set(timer), serializer_seconds.set(elapsed)
+        profiler = cProfile.Profile() if self.cprofile_threshold is not None else None
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.disable()
+            _reset(tokens)
+        duration = time.perf_counter() - started
+        self._record(request, response, timer, elapsed[0], duration)
+        if profiler and duration * 1000 >= self.cprofile_threshold:
+            self._dump(profiler, _view_labels(request), duration)
+        return response
+
+    async def __acall__(self, request):
+        """
+        Async path, used when the stack runs under ASGI. cProfile is not
+        used here: it would only see the event loop thread.
+        """
+        if not self._sampled():
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        elapsed = [0.0]
+        tokens = query_timer.set(timer), serializer_seconds.set(elapsed)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reset(tokens)
+        self._record(request, response, timer, elapsed[0],
+                     time.perf_counter() - started)
+        return response
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate  # nosec B311
+
+    def _record(self, request, response, timer, serializer_time, duration):
+        labels = _view_labels(request)
+        REQUESTS.inc(labels + (('status', f'{response.status_code // 100}xx'),))
+        REQUEST_DURATION.observe(labels, duration)
+        SQL_QUERIES.observe(labels, timer.count)
+        SQL_DURATION.observe(labels, timer.seconds)
+        SERIALIZER_DURATION.observe(labels, serializer_time)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+    def _dump(self, profiler, labels, duration):
+        self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+        name = '-'.join(value for _, value in labels)
+        path = self.cprofile_dir / f'{int(time.time() * 1000)}-{name}.prof'
+        profiler.dump_stats(path)
+        logger.info("Slow request profile (%.0f ms) saved to %s", duration * 1000, path)
+
+
+def _reset(tokens):
+    query_token, serializer_token = tokens
+    query_timer.reset(query_token)
+    serializer_seconds.reset(serializer_token)
+
+
+def _view_labels(request):
+    match = request.resolver_match
+    if match is None:
+        return (('view', 'unresolved'), ('action', ''))
+    view = match.func
+    cls = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    name = cls.__name__ if cls else getattr(view, '__name__', match.view_name)
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return (('view', name), ('action', action))
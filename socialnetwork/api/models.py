@@ -1,7 +1,17 @@
-from django.contrib.auth.hashers import check_password, make_password
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import bump_day_versions
+from .hashers import check_password, make_password
+from .hyperloglog import RaiseRegister
+from .trending import score_updates
 
 
 class ApiUser(AbstractUser):
@@ -11,6 +21,7 @@ class ApiUser(AbstractUser):
     last_request = models.DateTimeField(
         null=True, blank=True, default=timezone.now)
     password_hash = models.CharField(max_length=128)
+    follower_count = models.PositiveIntegerField(default=0)
 
     def hash_password(self, password):
         """
@@ -21,11 +32,17 @@ class ApiUser(AbstractUser):
 
     def verify_password(self, password):
         """
-        Verifies the given password against the stored password hash.
+        Verifies the given password against the stored password hash. A
+        matching hash made with another hasher or other costs than the
+        current policy is replaced with a fresh one.
         :param password: str
         :return: bool
         """
-        return check_password(password, self.password_hash)
+        valid, must_update = check_password(password, self.password_hash)
+        if valid and must_update:
+            self.hash_password(password)
+            self.save(update_fields=['password_hash'])
+        return valid
 
     def __str__(self):
         return self.username
@@ -36,20 +53,283 @@ class Post(models.Model):
         ApiUser, on_delete=models.CASCADE, related_name='posts')
     title = models.CharField(max_length=80)
     body = models.TextField()
-    pub_date = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so bulk inserts such as the seeder
+    # can set dates in the past
+    pub_date = models.DateTimeField(default=timezone.now, editable=False)
+    like_count = models.PositiveIntegerField(default=0)
+    # Forward-decayed like score, see api.trending
+    trending_score = models.FloatField(default=0.0)
+    trending_epoch = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-like_count', '-id'], name='post_popularity_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='post_trending_idx',
+                         condition=models.Q(trending_score__gt=0)),
+            models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+            models.Index(fields=['user', '-pub_date'], name='post_user_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class LikeManager(models.Manager):
+    """
+    Like/unlike in a single INSERT ... ON CONFLICT or DELETE ... RETURNING
+    statement, so the hot path needs no SELECT first and cannot race. Both
+    bypass the Like signals and adjust like_count, the trending score and
+    the daily rollup, with its user sketch, in bulk themselves.
+    """
+
+    def add_many(self, user, post_ids):
+        """
+        Likes the given posts on behalf of user, skipping existing likes.
+        :param user: ApiUser
+        :param post_ids: list of int, without duplicates
+        :return: list of post ids that were newly liked
+        """
+        if not post_ids:
+            return []
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        now = timezone.now()
+        date = connection.ops.adapt_datetimefield_value(now)
+        rows = ', '.join(['(%s, %s, %s, %s)'] * len(post_ids))
+        params = []
+        for post_id in post_ids:
+            params.extend([post_id, user.pk, True, date])
+        sql = (
+            f'INSERT INTO {qn(self.model._meta.db_table)} '
+            f'({qn("post_id")}, {qn("user_id")}, {qn("state")}, {qn("date")}) '
+            f'VALUES {rows} '
+            f'ON CONFLICT ({qn("user_id")}, {qn("post_id")}) DO NOTHING '
+            f'RETURNING {qn("post_id")}'
+        )
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                added = [row[0] for row in cursor.fetchall()]
+            self._update_counters([(post_id, now) for post_id in added], 1, user.pk)
+        return added
+
+    def remove_many(self, user, post_ids):
+        """
+        Removes the likes of user on the given posts.
+        :param user: ApiUser
+        :param post_ids: list of int
+        :return: list of post ids that were unliked
+        """
+        if not post_ids:
+            return []
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        sql = (
+            f'DELETE FROM {qn(self.model._meta.db_table)} '
+            f'WHERE {qn("user_id")} = %s AND {qn("post_id")} IN ({placeholders}) '
+            f'RETURNING {qn("post_id")}, {qn("date")}'
+        )
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [user.pk, *post_ids])
+                removed = [(post_id, self._to_datetime(date))
+                           for post_id, date in cursor.fetchall()]
+            self._update_counters(removed, -1)
+        return [post_id for post_id, _ in removed]
+
+    def _update_counters(self, changes, delta, user_id=None):
+        if not changes:
+            return
+        post_ids = [post_id for post_id, _ in changes]
+        Post.objects.using(self.db).filter(id__in=post_ids).update(
+            like_count=Greatest(F('like_count') + delta, 0),
+            **score_updates(changes, delta))
+        by_day = defaultdict(list)
+        for post_id, date in changes:
+            by_day[timezone.localdate(date)].append(post_id)
+        for day, day_post_ids in by_day.items():
+            DailyLikeStats.bump_many(day, day_post_ids, delta, user_id)
+
+    @staticmethod
+    def _to_datetime(value):
+        # SQLite hands back text, PostgreSQL a datetime
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return value
+
+
 class Like(models.Model):
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, related_name='likes')
     user = models.ForeignKey(
         ApiUser, on_delete=models.CASCADE, related_name='likes')
     state = models.BooleanField(default=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now, editable=False)
     public_id = models.AutoField(unique=True, primary_key=True)
 
+    objects = LikeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_like_user_post'),
+        ]
+        indexes = [
+            # Covers the reads of the like series over a date range
+            models.Index(fields=['date', 'post'], name='like_date_post_idx'),
+        ]
+
     def __repr__(self):
         return f'<Like {self.public_id}, {self.state}>'
+
+
+class DailyLikeStats(models.Model):
+    """
+    Rollup of like counts per day. Rows with an empty post hold the totals
+    for the whole day, rows with a post hold the count for that post only.
+    Total rows also hold the day's sketch of the users who liked something
+    in registers, see api.hyperloglog.
+    """
+    day = models.DateField()
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='daily_like_stats',
+        null=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    registers = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'post'], name='unique_daily_like_stats_post',
+                condition=models.Q(post__isnull=False)),
+            models.UniqueConstraint(
+                fields=['day'], name='unique_daily_like_stats_total',
+                condition=models.Q(post__isnull=True)),
+        ]
+
+    @classmethod
+    def bump(cls, day, post_id, delta, user_id=None):
+        """
+        Adds delta to the day total and to the post's row for that day.
+        :param day: date
+        :param post_id: int
+        :param delta: int
+        :param user_id: int, user to add to the day's sketch
+        """
+        cls.bump_many(day, [post_id], delta, user_id)
+
+    @classmethod
+    def bump_many(cls, day, post_ids, delta, user_id=None):
+        """
+        Adds delta to the rows of every given post for that day and
+        delta * len(post_ids) to the day total, and the user to the day's
+        sketch in the same statement. Missing rows are created with a zero
+        count first, so concurrent callers never lose updates.
+        :param day: date
+        :param post_ids: list of int, without duplicates
+        :param delta: int
+        :param user_id: int, user to add to the day's sketch
+        """
+        if not post_ids:
+            return
+        with transaction.atomic():
+            if delta > 0:
+                cls.objects.bulk_create(
+                    [cls(day=day, post=None)]
+                    + [cls(day=day, post_id=post_id) for post_id in post_ids],
+                    ignore_conflicts=True)
+            cls.objects.filter(day=day, post_id__in=post_ids)\
+                .update(count=Greatest(F('count') + delta, 0))
+            totals = {'count': Greatest(F('count') + delta * len(post_ids), 0)}
+            if user_id is not None:
+                totals['registers'] = RaiseRegister('registers', user_id)
+            cls.objects.filter(day=day, post__isnull=True).update(**totals)
+            transaction.on_commit(lambda: bump_day_versions([day]))
+
+    def __repr__(self):
+        return f'<DailyLikeStats {self.day}, {self.post_id}, {self.count}>'
+
+
+class FollowManager(models.Manager):
+    """
+    Follow/unfollow keeping ApiUser.follower_count in step, which decides
+    whether an author's posts are fanned out to timelines or fanned in on
+    read.
+    """
+
+    def add(self, follower, followee):
+        """
+        :param follower: ApiUser
+        :param followee: ApiUser
+        :return: bool, False when follower already follows followee
+        """
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(follower=follower, followee=followee)
+                ApiUser.objects.using(self.db).filter(pk=followee.pk)\
+                    .update(follower_count=F('follower_count') + 1)
+        except IntegrityError:
+            return False
+        return True
+
+    def remove(self, follower, followee):
+        """
+        :param follower: ApiUser
+        :param followee: ApiUser
+        :return: bool, False when follower did not follow followee
+        """
+        with transaction.atomic(using=self.db):
+            deleted, _ = self.filter(follower=follower, followee=followee).delete()
+            if deleted:
+                ApiUser.objects.using(self.db).filter(pk=followee.pk)\
+                    .update(follower_count=Greatest(F('follower_count') - 1, 0))
+        return bool(deleted)
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(
+        ApiUser, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(
+        ApiUser, on_delete=models.CASCADE, related_name='followers')
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = FollowManager()
+
+    class Meta:
+        constraints = [
+            # Also the index fan-out walks the followers of an author with
+            models.UniqueConstraint(
+                fields=['followee', 'follower'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['follower', 'followee'], name='follow_follower_idx'),
+        ]
+
+    def __repr__(self):
+        return f'<Follow {self.follower_id} -> {self.followee_id}>'
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in a user's precomputed home timeline. pub_date is copied from
+    the post so a timeline page is read from the index alone.
+    """
+    user = models.ForeignKey(ApiUser, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __repr__(self):
+        return f'<TimelineEntry {self.user_id}, {self.post_id}>'
@@ -0,0 +1,153 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+class PostCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (pub_date, id), so deep pages cost the same as
+    the first one. ?ordering=popular pages over (like_count, id) instead.
+
+    The cursor holds the ordering value and the id of the last row of the
+    page, and the next page starts strictly after that pair, so any number
+    of rows that tie on the ordering value is paged through without an
+    offset.
+
+    paginate_queryset is split into building the page query and reading
+    the page from its rows, so apaginate_queryset can fetch the rows with
+    the async ORM.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+    popular_ordering = ('-like_count', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering') == 'popular':
+            return self.popular_ordering
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.read_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.read_page([obj async for obj in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """
+        Returns the query for the requested page plus one row, which tells
+        whether a following page exists, or None without pagination.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        # Cursor pagination always enforces an ordering.
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        # Seek past the (value, id) pair of the cursor
+        if self.cursor is not None:
+            (field, id_field) = (order.lstrip('-') for order in self.ordering)
+            value, pk = self.cursor.position
+            # Test for: (cursor reversed) XOR (queryset reversed)
+            lookup = 'lt' if reverse != self.ordering[0].startswith('-') else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value})
+                | Q(**{field: value, f'{id_field}__{lookup}': pk}))
+
+        return queryset[:self.page_size + 1]
+
+    def read_page(self, results):
+        """
+        Sets the page and the next and previous positions from the rows of
+        the query built by page_queryset.
+        :return: list of the page rows
+        """
+        reverse = self.cursor is not None and self.cursor.reverse
+        self.page = list(results[:self.page_size])
+        has_more = len(results) > len(self.page)
+        if reverse:
+            # The query ran in reverse, so put the page back in order
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        if self.page:
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering)
+        elif self.cursor is not None:
+            # Nothing past the cursor, so the way back starts at it
+            self.next_position = self.previous_position = self.cursor.position
+
+        # Display page controls in the browsable API if there is more
+        # than one page.
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False,
+                                         position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True,
+                                         position=self.previous_position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        (field, id_field) = (order.lstrip('-') for order in ordering)
+        return str(getattr(instance, field)), getattr(instance, id_field)
+
+    def decode_cursor(self, request):
+        """
+        :return: Cursor with the (value, id) position of the request, or
+            None for the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = (tokens['p'][0], int(tokens['i'][0]))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        value, pk = cursor.position
+        tokens = {'p': value, 'i': pk}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
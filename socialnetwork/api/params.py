@@ -0,0 +1,33 @@
+"""
+Query string parameters shared by the views that read optional filters.
+"""
+from datetime import datetime
+
+from rest_framework.exceptions import ValidationError
+
+
+def int_param(query_params, name):
+    """
+    :return: int, or None when the parameter is missing
+    :raises ValidationError: when it is not a non-negative integer
+    """
+    value = query_params.get(name)
+    if value is None:
+        return None
+    if not (value.isascii() and value.isdecimal()):
+        raise ValidationError({name: 'A non-negative integer is required.'})
+    return int(value)
+
+
+def date_param(query_params, name):
+    """
+    :return: date, or None when the parameter is missing
+    :raises ValidationError: when it is not a YYYY-MM-DD date
+    """
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError({name: 'Invalid date format. Use YYYY-MM-DD.'})
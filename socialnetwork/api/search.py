@@ -0,0 +1,171 @@
+"""
+Ranked full-text search over post titles and bodies.
+
+SQLite keeps an FTS5 index in an external-content virtual table next to
+api_post. PostgreSQL keeps a generated tsvector column with a GIN index.
+Both are created after migrate and kept in sync by the database itself
+(triggers on SQLite, the generated column on PostgreSQL), so bulk inserts,
+queryset updates and deletes are indexed too.
+
+Titles weigh more than bodies. A term ending in * matches every word it is
+a prefix of; all terms must match.
+"""
+import base64
+import json
+import re
+
+from django.apps import apps
+from django.db import connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from rest_framework.exceptions import NotFound, ValidationError
+
+TERM = re.compile(r'(\w+)(\*?)')
+MAX_TERMS = 16
+
+
+def parse_query(q):
+    """
+    Splits the query into terms, dropping everything but word characters
+    and a trailing * for prefix terms.
+    :param q: str
+    :return: list of tuples of term and whether it is a prefix
+    :raises ValidationError: when the query has no terms
+    """
+    terms = [(term.lower(), bool(star)) for term, star in TERM.findall(q or '')]
+    if not terms:
+        raise ValidationError({'q': 'A search query is required.'})
+    return terms[:MAX_TERMS]
+
+
+class SQLiteSearch:
+    table = 'api_post_fts'
+
+    def install(self, cursor, posts):
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [self.table])
+        exists = cursor.fetchone() is not None
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"title, body, content='{posts}', content_rowid='id', "
+            f"tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')")
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_insert AFTER INSERT ON {posts} "
+            f"BEGIN INSERT INTO {self.table} (rowid, title, body) "
+            f"VALUES (new.id, new.title, new.body); END")
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_delete AFTER DELETE ON {posts} "
+            f"BEGIN INSERT INTO {self.table} ({self.table}, rowid, title, body) "
+            f"VALUES ('delete', old.id, old.title, old.body); END")
+        # Only edits of the indexed columns touch the index, not like_count
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_update "
+            f"AFTER UPDATE OF title, body ON {posts} "
+            f"BEGIN INSERT INTO {self.table} ({self.table}, rowid, title, body) "
+            f"VALUES ('delete', old.id, old.title, old.body); "
+            f"INSERT INTO {self.table} (rowid, title, body) "
+            f"VALUES (new.id, new.title, new.body); END")
+        if not exists:
+            # Index the posts that were there before the index
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('rebuild')")
+
+    def match(self, terms):
+        return ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+
+    def search(self, cursor, posts, terms, position, size):
+        # bm25 is lower for better matches; negated so higher scores rank first
+        sql = (f"SELECT id, score FROM (SELECT rowid AS id, "
+               f"-bm25({self.table}, 4.0, 1.0) AS score FROM {self.table} "
+               f"WHERE {self.table} MATCH %s)")
+        params = [self.match(terms)]
+        return _page(cursor, sql, params, position, size)
+
+
+class PostgreSQLSearch:
+    column = 'search_vector'
+    config = 'english'
+
+    def install(self, cursor, posts):
+        cursor.execute(
+            f"ALTER TABLE {posts} ADD COLUMN IF NOT EXISTS {self.column} tsvector "
+            f"GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{self.config}', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(body, '')), 'B')) STORED")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {posts}_search_idx "
+            f"ON {posts} USING GIN ({self.column})")
+
+    def match(self, terms):
+        return ' & '.join(f"'{term}':*" if prefix else f"'{term}'"
+                          for term, prefix in terms)
+
+    def search(self, cursor, posts, terms, position, size):
+        sql = (f"SELECT id, score FROM (SELECT id, "
+               f"ts_rank_cd({self.column}, query)::float8 AS score "
+               f"FROM {posts}, to_tsquery('{self.config}', %s) query "
+               f"WHERE {self.column} @@ query) matches")
+        return _page(cursor, sql, [self.match(terms)], position, size)
+
+
+def _page(cursor, sql, params, position, size):
+    if position is not None:
+        sql += ' WHERE score < %s OR (score = %s AND id > %s)'
+        params += [position[0], position[0], position[1]]
+    sql += ' ORDER BY score DESC, id LIMIT %s'
+    cursor.execute(sql, params + [size + 1])
+    return cursor.fetchall()
+
+
+def _posts_table():
+    return apps.get_model('api', 'Post')._meta.db_table
+
+
+BACKENDS = {'sqlite': SQLiteSearch(), 'postgresql': PostgreSQLSearch()}
+
+
+def search_posts(q, position, size, using):
+    """
+    :param q: str, the search query
+    :param position: tuple of score and post id of the last result already
+        seen, or None for the first page
+    :param size: int
+    :param using: database alias
+    :return: list of up to size + 1 tuples of post id and score, best first
+    """
+    terms = parse_query(q)
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        return BACKENDS[connection.vendor].search(
+            cursor, _posts_table(), terms, position, size)
+
+
+def encode_search_cursor(score, post_id):
+    return base64.urlsafe_b64encode(json.dumps([score, post_id]).encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """
+    :param cursor: str or None
+    :return: tuple of score and post id, or None
+    :raises NotFound: for a malformed cursor, as DRF's cursor pagination does
+    """
+    if not cursor:
+        return None
+    try:
+        score, post_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(post_id)
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    if sender.name != 'api':
+        return
+    connection = connections[using]
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.install(cursor, _posts_table())
@@ -0,0 +1,130 @@
+import random
+from multiprocessing import get_context
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from .models import ApiUser, Like, Post
+
+BODY = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. '
+
+
+def split(total, parts):
+    """
+    Splits total into parts sizes that differ by at most one.
+    :return: list of int
+    """
+    size, remainder = divmod(total, parts)
+    return [size + (index < remainder) for index in range(parts)]
+
+
+def random_date(rng, now, days):
+    return now - timezone.timedelta(seconds=rng.randrange(days * 86400))
+
+
+def seed_users(count, prefix, password, batch_size):
+    """
+    Inserts users sharing one precomputed password hash, so seeding does not
+    pay for a key derivation per user.
+    :return: list of the seeded user ids
+    """
+    password_hash = make_password(password)
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        ApiUser.objects.bulk_create(
+            [ApiUser(username=f'{prefix}{index}', password_hash=password_hash,
+                     last_login=now, last_request=now)
+             for index in range(start, min(start + batch_size, count))],
+            ignore_conflicts=True)
+    return list(ApiUser.objects.filter(username__startswith=prefix)
+                .order_by('public_id').values_list('public_id', flat=True))
+
+
+def seed_posts(count, user_ids, days, batch_size, seed):
+    """
+    Inserts count posts by random seeded users, published over the last days.
+    """
+    rng = random.Random(f'posts-{seed}')
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        Post.objects.bulk_create([
+            Post(user_id=rng.choice(user_ids), title=f'Seeded post {index}',
+                 body=BODY * rng.randint(1, 20), pub_date=random_date(rng, now, days))
+            for index in range(start, min(start + batch_size, count))])
+
+
+def seed_likes(count, user_ids, post_ids, days, batch_size, seed):
+    """
+    Inserts count likes spread over user_ids. Each user likes distinct posts,
+    so no (user, post) pair repeats and no global set of pairs is needed.
+    """
+    rng = random.Random(f'likes-{seed}')
+    now = timezone.now()
+    per_user = split(min(count, len(user_ids) * len(post_ids)), len(user_ids))
+    batch = []
+    for user_id, likes in zip(user_ids, per_user):
+        for post_id in rng.sample(post_ids, likes):
+            batch.append(Like(user_id=user_id, post_id=post_id,
+                              date=random_date(rng, now, days)))
+            if len(batch) >= batch_size:
+                Like.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+    Like.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _run(task):
+    function, args = task
+    try:
+        function(*args)
+    finally:
+        connections.close_all()
+
+
+def run_parallel(tasks, workers):
+    """
+    Runs (function, args) tasks in a pool of worker processes, or inline for
+    a single worker and on SQLite. SQLite has a single writer anyway, and
+    its deferred transactions fail with "database is locked" instead of
+    waiting when workers write at the same time.
+    """
+    if workers <= 1 or connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+        for function, args in tasks:
+            function(*args)
+        return
+    # forkserver, as forking a process that runs the log listener thread can
+    # deadlock the child. Workers set Django up from the environment and open
+    # their own connections.
+    connections.close_all()
+    with get_context('forkserver').Pool(workers, initializer=django.setup) as pool:
+        pool.map(_run, tasks)
+
+
+def seed(users, posts, likes, days=30, batch_size=5000, seed=0, workers=1,
+         prefix='seed', password='Seeded123'):
+    """
+    Seeds users, posts and likes. Posts and likes are generated in one
+    chunk per worker, each with its own deterministic random stream.
+    :return: tuple of the seeded user ids and post ids
+    """
+    user_ids = seed_users(users, prefix, password, batch_size)
+    if not user_ids:
+        return [], []
+    first_post_id = (Post.objects.order_by('-id').values_list('id', flat=True)
+                     .first() or 0)
+    run_parallel([
+        (seed_posts, (chunk, user_ids, days, batch_size, f'{seed}-{index}'))
+        for index, chunk in enumerate(split(posts, workers)) if chunk], workers)
+    post_ids = list(Post.objects.filter(id__gt=first_post_id)
+                    .order_by('id').values_list('id', flat=True))
+    if not post_ids:
+        return user_ids, post_ids
+
+    user_chunks = [user_ids[index::workers] for index in range(workers)]
+    like_chunks = split(likes, workers)
+    run_parallel([
+        (seed_likes, (chunk, user_chunk, post_ids, days, batch_size, f'{seed}-{index}'))
+        for index, (chunk, user_chunk) in enumerate(zip(like_chunks, user_chunks))
+        if chunk and user_chunk], workers)
+    return user_ids, post_ids
@@ -44,8 +44,8 @@ class UserSerializer(serializers.ModelSerializer):
 class PostSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
-        fields = ['id', 'user', 'title', 'body', 'pub_date']
-        read_only_fields = ['user', 'pub_date']
+        fields = ['id', 'user', 'title', 'body', 'pub_date', 'like_count']
+        read_only_fields = ['user', 'pub_date', 'like_count']
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -55,5 +55,15 @@ class LikeSerializer(serializers.ModelSerializer):
 
 
 class AnalyticsSerializer(serializers.Serializer):
-    date = serializers.DateField(source='date__date')
+    date = serializers.DateField(source='day')
     count = serializers.IntegerField()
+    unique_users = serializers.IntegerField()
+
+
+class BulkLikeItemSerializer(serializers.Serializer):
+    post_id = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+
+
+class BulkLikeSerializer(serializers.Serializer):
+    items = BulkLikeItemSerializer(many=True, allow_empty=False, max_length=500)
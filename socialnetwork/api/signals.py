@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import invalidate_user_snapshot
+from .models import ApiUser, DailyLikeStats, Like, Post
+from .trending import score_updates
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            like_count=F('like_count') + 1,
+            **score_updates([(instance.post_id, instance.date)], 1))
+        DailyLikeStats.bump(timezone.localdate(instance.date), instance.post_id, 1,
+                            instance.user_id)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        like_count=Greatest(F('like_count') - 1, 0),
+        **score_updates([(instance.post_id, instance.date)], -1))
+    DailyLikeStats.bump(timezone.localdate(instance.date), instance.post_id, -1)
+
+
+@receiver(post_save, sender=ApiUser)
+@receiver(post_delete, sender=ApiUser)
+def user_changed(sender, instance, **kwargs):
+    # Password changes and deactivation must not wait for the snapshot to
+    # expire. Dropped after commit, so a concurrent request cannot cache the
+    # old row again.
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user_snapshot(user_id))
@@ -1,15 +1,76 @@
-from django.contrib.auth import get_user_model
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from io import StringIO
+from logging.handlers import QueueHandler
+from pathlib import Path
+
+import numpy as np
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import (AsyncRequestFactory, RequestFactory, SimpleTestCase,
+                         override_settings)
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Like, Post
+from . import async_views
+from .activity import LastSeenTracker, last_seen
+from .analytics import cached_range, check_lease_cache, range_cache_key
+from .authentication import snapshot_key
+from .cache import INVALIDATION_LOG_KEY, TieredCache
+from .db import ReplicaRouter, replica_reads
+from .export import NDJSONFormat, astream, export_params, like_rows
+from .feed import FanoutWorker, fan_out
+from .hashers import HashingPool, _check_password
+from .hyperloglog import (REGISTERS, STANDARD_ERROR, daily_sketches,
+                          daily_unique_users, estimate, register_of,
+                          unique_users)
+from .log import SAMPLED, BackgroundListener, JsonFormatter, SampleFilter
+from .metrics import render_metrics
+from .middleware import ProfilingMiddleware
+from .models import DailyLikeStats, Follow, Like, Post, TimelineEntry
+from .pagination import PostCursorPagination
+from .seeding import seed
+from .timeseries import bucket_counts, bucket_edges
+from .trending import current_epoch, score_updates, trending_posts
+from .views import ANALYTICS_VARIANT
 
 User = get_user_model()
 
 
+class AuthenticatedClientMixin:
+    """
+    Starts every test with an empty cache and the client signed in as
+    testuser with a bearer token. Also creates self.post, a post of theirs,
+    unless with_post is False.
+    """
+    with_post = True
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        if self.with_post:
+            self.post = Post.objects.create(
+                user=self.user, title='Test Post', body='This is a test post.')
+
+
 class UserTests(APITestCase):
     def setUp(self):
         self.signup_url = reverse('user-signup')
@@ -98,3 +159,1152 @@ class PostTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('data', response.data)
         self.assertTrue(len(response.data['data']) > 0)
+
+
+class DailyLikeStatsTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+
+    def test_like_and_unlike_update_rollup(self):
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        total = DailyLikeStats.objects.get(day=self.today, post__isnull=True)
+        per_post = DailyLikeStats.objects.get(day=self.today, post=self.post)
+        self.assertEqual(total.count, 1)
+        self.assertEqual(per_post.count, 1)
+
+        self.client.post(reverse('post-unlike', kwargs={'pk': self.post.pk}))
+        total.refresh_from_db()
+        per_post.refresh_from_db()
+        self.assertEqual(total.count, 0)
+        self.assertEqual(per_post.count, 0)
+
+    def test_rebuild_command_backfills_rollup(self):
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        Like.objects.create(user=self.user, post=self.post)
+        Like.objects.create(user=other, post=self.post)
+        DailyLikeStats.objects.all().delete()
+
+        call_command('rebuild_like_stats', stdout=StringIO())
+        total = DailyLikeStats.objects.get(day=self.today, post__isnull=True)
+        self.assertEqual(total.count, 2)
+        self.assertEqual(
+            DailyLikeStats.objects.get(day=self.today, post=self.post).count, 2)
+
+        response = self.client.get(reverse('post-analytics'), {
+            'date_from': self.today.strftime('%Y-%m-%d'),
+            'date_to': self.today.strftime('%Y-%m-%d')})
+        self.assertEqual(response.data['data'][0]['count'], 2)
+
+
+class LastSeenTrackerTests(AuthenticatedClientMixin, APITestCase):
+    with_post = False
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(
+            username='otheruser', password='testpass123')
+
+    def test_hits_are_merged_and_flushed_in_bulk(self):
+        tracker = LastSeenTracker(flush_interval=3600, flush_size=100)
+        first = timezone.now() + timezone.timedelta(minutes=1)
+        latest = first + timezone.timedelta(minutes=1)
+        tracker.touch(self.user.pk, latest)
+        tracker.touch(self.user.pk, first)
+        tracker.touch(self.other.pk, first)
+        self.assertEqual(tracker.pending(self.user.pk), latest)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(tracker.flush(), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_request, latest)
+        self.assertIsNone(tracker.pending(self.user.pk))
+
+    def test_flushes_when_size_threshold_reached(self):
+        tracker = LastSeenTracker(flush_interval=3600, flush_size=2)
+        timestamp = timezone.now() + timezone.timedelta(minutes=1)
+        tracker.touch(self.user.pk, timestamp)
+        tracker.touch(self.other.pk, timestamp)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.last_request, timestamp)
+
+    def test_activity_reads_pending_buffer(self):
+        response = self.client.get(reverse('user-activity'))
+        self.assertEqual(response.data['last_request'], last_seen.pending(self.user.pk))
+        last_seen.flush()
+
+    def test_activity_returns_the_time_of_the_request(self):
+        started = timezone.now()
+        flush_size, last_seen.flush_size = last_seen.flush_size, 1
+        try:
+            # The request's own hit fills the buffer and flushes it
+            response = self.client.get(reverse('user-activity'))
+        finally:
+            last_seen.flush_size = flush_size
+        self.assertIsNone(last_seen.pending(self.user.pk))
+        self.user.refresh_from_db()
+        self.assertEqual(response.data['last_request'], self.user.last_request)
+        self.assertGreaterEqual(response.data['last_request'], started)
+
+
+class LastSeenTimerTests(APITransactionTestCase):
+    def test_idle_buffer_is_flushed_by_the_timer(self):
+        user = User.objects.create_user(username='idleuser', password='testpass123')
+        tracker = LastSeenTracker(flush_interval=0.05, flush_size=100)
+        timestamp = timezone.now() + timezone.timedelta(minutes=1)
+        tracker.touch(user.pk, timestamp)
+        deadline = time.monotonic() + 5
+        while user.last_request != timestamp and time.monotonic() < deadline:
+            time.sleep(0.01)
+            user.refresh_from_db()
+        tracker.stop()
+        self.assertEqual(user.last_request, timestamp)
+
+
+class LikeCountTests(AuthenticatedClientMixin, APITestCase):
+    def test_like_and_unlike_change_like_count(self):
+        response = self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.data['post']['like_count'], 1)
+        response = self.client.post(reverse('post-unlike', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.data['post']['like_count'], 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(like_count=7)
+        out = StringIO()
+        call_command('reconcile_like_counts', batch_size=1, stdout=out)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertIn('fixed 1', out.getvalue())
+
+    def test_popular_ordering(self):
+        other = Post.objects.create(user=self.user, title='Other', body='Other post.')
+        Like.objects.create(user=self.user, post=other)
+        response = self.client.get(reverse('post-list'), {'ordering': 'popular'})
+        self.assertEqual(response.data['results'][0]['id'], other.id)
+
+
+class PostPaginationTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(
+            username='otheruser', password='testpass123')
+        self.post_url = reverse('post-list')
+        for i in range(4):
+            Post.objects.create(user=self.user, title=f'Post {i}', body='Body')
+        Post.objects.create(user=self.other, title='Other', body='Body')
+
+    def test_cursor_pages_cover_all_posts_once(self):
+        seen = []
+        response = self.client.get(self.post_url, {'page_size': 2})
+        while True:
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(post['id'] for post in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, sorted(Post.objects.values_list('id', flat=True),
+                                      reverse=True))
+
+    def test_pages_seek_past_ties_on_the_ordering_field(self):
+        Post.objects.bulk_create([Post(user=self.other, title=f'Tied {i}', body='Body')
+                                  for i in range(1100)])
+        pages = []
+        response = self.client.get(self.post_url, {'ordering': 'popular',
+                                                   'page_size': 100})
+        while True:
+            pages.append([post['id'] for post in response.data['results']])
+            if not response.data['next']:
+                break
+            self.assertLess(len(pages), 20)
+            response = self.client.get(response.data['next'])
+        seen = [pk for page in pages for pk in page]
+        self.assertEqual(seen, sorted(Post.objects.values_list('id', flat=True),
+                                      reverse=True))
+
+        # Previous links walk the same pages back
+        for page in reversed(pages[:-1]):
+            response = self.client.get(response.data['previous'])
+            self.assertEqual([post['id'] for post in response.data['results']], page)
+        self.assertIsNone(response.data['previous'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.post_url, {'cursor': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.post_url, {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(PostCursorPagination.max_page_size, 100)
+
+    def test_user_filter(self):
+        response = self.client.get(self.post_url, {'user': self.other.pk})
+        self.assertEqual([post['title'] for post in response.data['results']], ['Other'])
+        for user in ('abc', '²'):
+            response = self.client.get(self.post_url, {'user': user})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkLikeTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse('post-bulk-like')
+        self.posts = [self.post] + [
+            Post.objects.create(user=self.user, title=f'Post {i}', body='Body')
+            for i in range(2)]
+
+    def test_bulk_like_and_unlike(self):
+        Like.objects.create(user=self.user, post=self.posts[2])
+        items = [
+            {'post_id': self.posts[0].pk, 'action': 'like'},
+            {'post_id': self.posts[1].pk, 'action': 'unlike'},
+            {'post_id': self.posts[2].pk, 'action': 'unlike'},
+            {'post_id': 999999, 'action': 'like'},
+        ]
+        response = self.client.post(self.bulk_url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['result'] for item in response.data['results']],
+                         ['liked', 'not_liked', 'unliked', 'not_found'])
+        self.assertEqual(
+            list(Like.objects.filter(user=self.user).values_list('post_id', flat=True)),
+            [self.posts[0].pk])
+
+        counts = dict(Post.objects.values_list('id', 'like_count'))
+        self.assertEqual(counts[self.posts[0].pk], 1)
+        self.assertEqual(counts[self.posts[2].pk], 0)
+        total = DailyLikeStats.objects.get(day=timezone.localdate(), post__isnull=True)
+        self.assertEqual(total.count, 1)
+
+    def test_bulk_like_is_idempotent(self):
+        items = [{'post_id': post.pk, 'action': 'like'} for post in self.posts]
+        self.client.post(self.bulk_url, {'items': items}, format='json')
+        response = self.client.post(self.bulk_url, {'items': items}, format='json')
+        self.assertEqual({item['result'] for item in response.data['results']},
+                         {'already_liked'})
+        self.assertEqual(Like.objects.count(), 3)
+
+    def test_bulk_like_rejects_invalid_items(self):
+        response = self.client.post(
+            self.bulk_url, {'items': [{'post_id': 1, 'action': 'poke'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LikeToggleTests(AuthenticatedClientMixin, APITestCase):
+    def test_duplicate_like_is_rejected_by_constraint(self):
+        Like.objects.create(user=self.user, post=self.post)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(user=self.user, post=self.post)
+
+    def test_add_and_remove_report_changes_only(self):
+        self.assertEqual(Like.objects.add_many(self.user, [self.post.pk]), [self.post.pk])
+        self.assertEqual(Like.objects.add_many(self.user, [self.post.pk]), [])
+        self.assertEqual(Like.objects.remove_many(self.user, [self.post.pk]),
+                         [self.post.pk])
+        self.assertEqual(Like.objects.remove_many(self.user, [self.post.pk]), [])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_unlike_without_like_creates_nothing(self):
+        response = self.client.post(reverse('post-unlike', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Like.objects.exists())
+        response = self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CompactLikeResponseTests(AuthenticatedClientMixin, APITestCase):
+    def test_compact_query_parameter(self):
+        url = reverse('post-like', kwargs={'pk': self.post.pk})
+        response = self.client.post(f'{url}?response=compact')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data,
+                         {'post_id': self.post.pk, 'liked': True, 'like_count': 1})
+
+    def test_compact_accept_profile(self):
+        Like.objects.create(user=self.user, post=self.post)
+        response = self.client.post(
+            reverse('post-unlike', kwargs={'pk': self.post.pk}),
+            HTTP_ACCEPT='application/json; profile=compact')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data,
+                         {'post_id': self.post.pk, 'liked': False, 'like_count': 0})
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        options = {'SHARED_ALIAS': 'shared', 'SYNC_INTERVAL': 0, 'MAX_ENTRIES': 2}
+        self.first = TieredCache('tiered-test-1', {'OPTIONS': options})
+        self.second = TieredCache('tiered-test-2', {'OPTIONS': options})
+        self.first.clear()
+
+    def tearDown(self):
+        self.first.clear()
+
+    def test_reads_fill_local_tier_and_count_hits(self):
+        self.first.set('answer', 42)
+        self.assertEqual(self.second.get('answer'), 42)
+        self.assertEqual(self.second.get('answer'), 42)
+        stats = self.second.stats()
+        self.assertGreaterEqual(stats['shared_hits'], 1)
+        self.assertGreaterEqual(stats['local_hits'], 1)
+
+    def test_writes_are_broadcast_to_other_local_tiers(self):
+        self.first.set('answer', 42)
+        self.assertEqual(self.second.get('answer'), 42)
+        self.first.set('answer', 43)
+        self.assertEqual(self.second.get('answer'), 43)
+        self.first.delete('answer')
+        self.assertIsNone(self.second.get('answer'))
+
+    def test_add_and_log_sequence_are_atomic_across_writers(self):
+        def write(index):
+            won = self.first.add('lease', index)
+            for key in range(10):
+                self.first.set(f'key-{index}-{key}', key)
+            return won
+
+        shared = self.first.shared
+        start = shared.get(INVALIDATION_LOG_KEY, 0)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            wins = list(pool.map(write, range(8)))
+        self.assertEqual(wins.count(True), 1)
+        seq = shared.get(INVALIDATION_LOG_KEY)
+        self.assertEqual(seq - start, 80)
+        logged = shared.get_many([f'{INVALIDATION_LOG_KEY}:{number}'
+                                  for number in range(start + 1, seq + 1)])
+        self.assertEqual(len(set(logged.values())), 80)
+
+    def test_overflowing_the_log_window_evicts_changed_prefixes_only(self):
+        options = {'SHARED_ALIAS': 'shared', 'SYNC_INTERVAL': 0, 'LOG_WINDOW': 4}
+        writer = TieredCache('tiered-test-3', {'OPTIONS': options})
+        reader = TieredCache('tiered-test-4', {'OPTIONS': options})
+        writer.set('auth_user_1', 'snapshot')
+        writer.set('analytics_day', 1)
+        self.assertEqual(reader.get('auth_user_1'), 'snapshot')
+        self.assertEqual(reader.get('analytics_day'), 1)
+
+        # The change to analytics_day falls out of the window of the reader
+        writer.set('analytics_day', 2)
+        for index in range(10):
+            writer.set(f'analytics_{index}', index)
+        # Bypasses the log, so only a cleared local tier would notice
+        writer.shared.set('auth_user_1', 'changed')
+        self.assertEqual(reader.get('analytics_day'), 2)
+        self.assertEqual(reader.get('auth_user_1'), 'snapshot')
+        self.assertEqual(reader.stats()['log_overflows'], 1)
+
+    def test_local_tier_is_bounded(self):
+        for key in ('a', 'b', 'c'):
+            self.first.set(key, key)
+        self.assertEqual(self.first.stats()['local_entries'], 2)
+        self.assertEqual(self.first.get('a'), 'a')
+
+
+class AnalyticsCacheTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(
+            username='otheruser', password='testpass123')
+        self.today = timezone.localdate()
+
+    def test_like_today_invalidates_ranges_including_today_only(self):
+        yesterday = self.today - timezone.timedelta(days=1)
+        past_key = range_cache_key(yesterday - timezone.timedelta(days=5), yesterday)
+        today_key = range_cache_key(yesterday, self.today)
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.add_many(self.user, [self.post.pk])
+        self.assertEqual(range_cache_key(
+            yesterday - timezone.timedelta(days=5), yesterday), past_key)
+        self.assertNotEqual(range_cache_key(yesterday, self.today), today_key)
+
+    def test_long_ranges_are_rejected(self):
+        url = reverse('post-analytics')
+        date_to = self.today.isoformat()
+        response = self.client.get(url, {'date_from': '0001-01-01', 'date_to': date_to})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        date_from = self.today - timezone.timedelta(days=settings.ANALYTICS_MAX_DAYS - 1)
+        response = self.client.get(url, {'date_from': date_from.isoformat(),
+                                         'date_to': date_to})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cached_analytics_reflect_new_likes(self):
+        params = {'date_from': self.today.strftime('%Y-%m-%d'),
+                  'date_to': self.today.strftime('%Y-%m-%d')}
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.add_many(self.user, [self.post.pk])
+        response = self.client.get(reverse('post-analytics'), params)
+        self.assertEqual(response.data['data'][0]['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.add_many(self.other, [self.post.pk])
+        response = self.client.get(reverse('post-analytics'), params)
+        self.assertEqual(response.data['data'][0]['count'], 2)
+
+
+class AnalyticsStampedeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() - timezone.timedelta(days=30)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return []
+
+    def test_empty_result_is_cached(self):
+        self.assertEqual(cached_range(self.day, self.day, self.compute), ([], False))
+        self.assertEqual(cached_range(self.day, self.day, self.compute), ([], True))
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_lease_is_held(self):
+        cached_range(self.day, self.day, self.compute)
+        cache_key = range_cache_key(self.day, self.day)
+        entry = cache.get(cache_key)
+        entry['expires_at'] = 0
+        cache.set(cache_key, entry)
+        cache.add(f'{cache_key}_lease', True)
+        self.assertEqual(cached_range(self.day, self.day, self.compute), ([], True))
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(f'{cache_key}_lease')
+        self.assertEqual(cached_range(self.day, self.day, self.compute), ([], False))
+        self.assertEqual(self.calls, 2)
+
+    def test_file_cache_without_lock_is_reported(self):
+        self.assertEqual(check_lease_cache(None), [])
+        file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                      'LOCATION': settings.CACHES['shared']['LOCATION']}
+        with override_settings(CACHES={'default': file_cache}):
+            self.assertEqual([warning.id for warning in check_lease_cache(None)],
+                             ['api.W001'])
+
+
+class SeedCommandTests(APITestCase):
+    def test_seed_generates_consistent_data(self):
+        call_command('seed', users=5, posts=20, likes=30, days=10, seed=7,
+                     stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 5)
+        self.assertEqual(Post.objects.count(), 20)
+        self.assertEqual(Like.objects.count(), 30)
+        self.assertEqual(sum(Post.objects.values_list('like_count', flat=True)), 30)
+        totals = DailyLikeStats.objects.filter(post__isnull=True)
+        self.assertEqual(sum(totals.values_list('count', flat=True)), 30)
+        self.assertGreater(totals.count(), 1)
+
+    def test_seed_is_reproducible(self):
+        call_command('seed', users=3, posts=10, likes=12, seed=3, prefix='first',
+                     skip_counters=True, stdout=StringIO())
+        first = sorted(Like.objects.values_list('user__username', 'post__title'))
+        Like.objects.all().delete()
+        Post.objects.all().delete()
+        call_command('seed', users=3, posts=10, likes=12, seed=3, prefix='first',
+                     skip_counters=True, stdout=StringIO())
+        second = sorted(Like.objects.values_list('user__username', 'post__title'))
+        self.assertEqual(first, second)
+
+    def test_seeded_dates_leave_other_inserts_alone(self):
+        started = timezone.now()
+        user_ids, post_ids = seed(3, 10, 12, days=10, seed=5, prefix='dated')
+        earliest = Post.objects.filter(id__in=post_ids).earliest('pub_date')
+        self.assertLess(earliest.pub_date, started - timezone.timedelta(hours=1))
+        post = Post.objects.create(user_id=user_ids[0], title='Live', body='Body')
+        like = Like.objects.create(user_id=user_ids[0], post=post)
+        self.assertGreaterEqual(post.pub_date, started)
+        self.assertGreaterEqual(like.date, started)
+
+
+class ProfilingMiddlewareTests(AuthenticatedClientMixin, APITestCase):
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_metrics_endpoint_exposes_request_histograms(self):
+        self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        for name in ('api_request_duration_seconds', 'api_request_sql_queries',
+                     'api_request_sql_duration_seconds',
+                     'api_request_serializer_duration_seconds',
+                     'api_response_size_bytes'):
+            self.assertIn(f'{name}_count{{view="PostViewSet",action="like"}}', body)
+        self.assertIn('api_cache_local_hits', body)
+
+    def test_metrics_endpoint_is_internal(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_slow_requests_are_dumped_as_cprofile_stats(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                PROFILING_SAMPLE_RATE=1.0, PROFILING_CPROFILE_THRESHOLD_MS=0,
+                PROFILING_CPROFILE_DIR=directory):
+            middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+            middleware(RequestFactory().get('/'))
+            self.assertEqual(len(list(Path(directory).glob('*.prof'))), 1)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+    def test_api_logger_writes_through_background_listener(self):
+        handlers = logging.getLogger('api').handlers
+        self.assertEqual([type(handler) for handler in handlers], [QueueHandler])
+        self.assertIsInstance(handlers[0].listener, BackgroundListener)
+        self.assertTrue(handlers[0].listener._thread.is_alive())
+
+    def test_listener_hands_records_to_target_handlers(self):
+        records = []
+        target = logging.Handler()
+        target.emit = records.append
+        listener = BackgroundListener(queue.Queue(), target)
+        listener.queue.put(logging.makeLogRecord({'msg': 'queued'}))
+        listener.stop()
+        self.assertEqual([record.getMessage() for record in records], ['queued'])
+
+    def test_sample_filter_only_drops_sampled_info_records(self):
+        sample = SampleFilter(rate=0)
+
+        def record(level, **extra):
+            return logging.makeLogRecord({'levelno': level, **extra})
+        self.assertFalse(sample.filter(record(logging.INFO, **SAMPLED)))
+        self.assertTrue(sample.filter(record(logging.INFO)))
+        self.assertTrue(sample.filter(record(logging.WARNING, **SAMPLED)))
+        self.assertTrue(SampleFilter(rate=1).filter(record(logging.INFO, **SAMPLED)))
+
+    def test_json_formatter_includes_extra_values(self):
+        record = logging.getLogger('api').makeRecord(
+            'api', logging.INFO, __file__, 1, 'Post liked: %s', (7,), None,
+            extra={'user': 'testuser', **SAMPLED})
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'Post liked: 7')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['user'], 'testuser')
+        self.assertNotIn('sampled', entry)
+
+
+class DatabaseProfileTests(AuthenticatedClientMixin, APITransactionTestCase):
+    def test_sqlite_connections_get_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_replica_router_only_routes_reads_inside_replica_reads(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post, instance=self.post), 'default')
+        self.assertIsNone(router.db_for_read(Post))
+        with replica_reads(), transaction.atomic():
+            self.assertIsNone(router.db_for_read(Post))
+
+    def test_post_list_and_analytics_read_from_replica(self):
+        routed = []
+
+        class RecordingRouter:
+            def db_for_read(self, model, **hints):
+                routed.append((model, ReplicaRouter().db_for_read(model)))
+
+        with override_settings(DATABASE_ROUTERS=[RecordingRouter()]):
+            self.client.get(reverse('post-list'))
+            self.assertIn((Post, 'replica'), routed)
+            routed.clear()
+            self.client.get(reverse('post-analytics'), {
+                'date_from': timezone.localdate().isoformat(),
+                'date_to': timezone.localdate().isoformat()})
+            self.assertIn((DailyLikeStats, 'replica'), routed)
+            routed.clear()
+            self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+            self.assertIn((Post, None), routed)
+            self.assertNotIn((Post, 'replica'), routed)
+
+
+class PasswordHashingTests(APITestCase):
+    def setUp(self):
+        self.login_url = reverse('user-login')
+        self.user = User.objects.create(username='hashuser')
+
+    def login(self):
+        return self.client.post(self.login_url, {'username': 'hashuser',
+                                                 'password': 'Testpass123'})
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_login_rehashes_with_current_policy(self):
+        self.user.password_hash = hashers.make_password(
+            'Testpass123', hasher='pbkdf2_sha256')
+        self.user.save()
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password_hash.startswith('argon2$'))
+
+        with override_settings(PASSWORD_ARGON2_TIME_COST=3):
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIn('t=3', self.user.password_hash)
+        self.assertFalse(self.user.verify_password('Wrongpass123'))
+
+    def test_hashing_pool_runs_in_worker_processes(self):
+        pool = HashingPool(workers=1)
+        self.addCleanup(pool.shutdown)
+        self.assertNotEqual(pool.run(os.getpid), os.getpid())
+        encoded = pool.run(hashers.make_password, 'Testpass123')
+        self.assertEqual(pool.run(_check_password, 'Testpass123', encoded), (True, False))
+        self.assertEqual(pool.run(_check_password, 'Wrongpass123', encoded),
+                         (False, False))
+
+
+class CachedAuthenticationTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.activity_url = reverse('user-activity')
+
+    def test_warm_requests_authenticate_without_sql(self):
+        self.client.get(self.activity_url)
+        last_seen.flush()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.activity_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.data['last_request'])
+        with self.assertNumQueries(1):
+            self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+
+    def test_password_change_and_deactivation_drop_snapshot(self):
+        key = snapshot_key(self.user.pk)
+        self.client.get(self.activity_url)
+        self.assertIsNotNone(cache.get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.hash_password('Changed123')
+            self.user.save()
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(self.client.get(self.activity_url).status_code,
+                         status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(self.activity_url).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='analyst', password='testpass123',
+                                              is_staff=True)
+        self.users = [User.objects.create_user(username=f'user{index}',
+                                               password='testpass123')
+                      for index in range(3)]
+        self.posts = [Post.objects.create(user=self.users[0], title=f'Post {index}',
+                                          body='Body') for index in range(2)]
+        self.likes = [Like.objects.create(user=user, post=post)
+                      for post in self.posts for user in self.users]
+        self.client.force_authenticate(self.staff)
+        self.likes_url = reverse('post-export-likes')
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_likes_export_filters_and_resumes_from_cursor(self):
+        rows = self.rows(self.client.get(self.likes_url))
+        self.assertEqual([row['id'] for row in rows], [like.pk for like in self.likes])
+        self.assertEqual(set(rows[0]), {'id', 'post_id', 'user_id', 'date'})
+
+        rows = self.rows(self.client.get(self.likes_url, {'post': self.posts[1].pk}))
+        self.assertEqual({row['post_id'] for row in rows}, {self.posts[1].pk})
+        resumed = self.rows(self.client.get(self.likes_url, {
+            'post': self.posts[1].pk, 'cursor': rows[0]['id']}))
+        self.assertEqual(resumed, rows[1:])
+
+        today = timezone.localdate()
+        rows = self.rows(self.client.get(self.likes_url, {
+            'user': self.users[2].pk, 'date_from': today.isoformat(),
+            'date_to': today.isoformat()}))
+        self.assertEqual(len(rows), 2)
+        tomorrow = (today + timezone.timedelta(days=1)).isoformat()
+        self.assertEqual(self.rows(self.client.get(self.likes_url,
+                                                   {'date_from': tomorrow})), [])
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_analytics_csv_export_is_streamed_in_chunks(self):
+        response = self.client.get(reverse('post-export-analytics'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,post_id,count')
+        self.assertEqual([line.split(',')[2:] for line in lines[1:]],
+                         [[str(post.pk), '3'] for post in self.posts])
+
+    def test_export_requires_staff_and_valid_parameters(self):
+        self.assertEqual(self.client.get(self.likes_url, {'format': 'xml'}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.likes_url, {'cursor': 'x'},
+                                   HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.content.decode().splitlines(),
+                         ['field,message', 'cursor,A non-negative integer is required.'])
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(self.likes_url).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    async def test_async_stream_matches_sync_export(self):
+        columns, queryset = like_rows(export_params({}))
+        chunks = [chunk async for chunk in astream(NDJSONFormat(columns), queryset, 4)]
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [like.pk for like in self.likes])
+
+
+@override_settings(FEED_FANOUT_BACKGROUND=False)
+class FeedTests(APITestCase):
+    def setUp(self):
+        self.reader, self.author, self.stranger = [
+            User.objects.create_user(username=name, password='testpass123')
+            for name in ('reader', 'author', 'stranger')]
+        self.client.force_authenticate(self.reader)
+        self.feed_url = reverse('feed')
+
+    def follow(self, user):
+        return self.client.post(reverse('user-follow', kwargs={'pk': user.pk}))
+
+    def post(self, user, title):
+        post = Post.objects.create(user=user, title=title, body='Body')
+        fan_out(post.id)
+        return post
+
+    def feed_titles(self, **params):
+        titles, url = [], self.feed_url
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [post['title'] for post in response.data['results']]
+            url, params = response.data['next'], {}
+        return titles
+
+    def test_feed_holds_followed_posts_newest_first(self):
+        self.post(self.author, 'Before follow')
+        self.assertEqual(self.follow(self.author).status_code, status.HTTP_200_OK)
+        self.post(self.stranger, 'Not followed')
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post-list'), {'title': 'Created', 'body': 'Body'})
+        self.client.force_authenticate(self.reader)
+        self.post(self.author, 'Latest')
+
+        self.assertEqual(self.feed_titles(page_size=2),
+                         ['Latest', 'Created', 'Before follow'])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 1)
+
+    def test_follow_rules_and_unfollow(self):
+        self.assertEqual(self.follow(self.reader).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.follow(self.author)
+        self.assertEqual(self.follow(self.author).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.post(self.author, 'Post')
+        response = self.client.post(reverse('user-unfollow',
+                                            kwargs={'pk': self.author.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.feed_titles(), [])
+        self.assertFalse(Follow.objects.exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 0)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_popular_authors_are_fanned_in_on_read(self):
+        self.follow(self.author)
+        self.follow(self.stranger)
+        User.objects.filter(pk=self.stranger.pk).update(follower_count=0)
+        self.post(self.author, 'Fanned in')
+        self.post(self.stranger, 'Fanned out')
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('post__title', flat=True)),
+            ['Fanned out'])
+        self.assertEqual(self.feed_titles(page_size=1), ['Fanned out', 'Fanned in'])
+
+    @override_settings(FEED_TIMELINE_SIZE=2, FEED_TRIM_INTERVAL=1)
+    def test_timelines_are_bounded_and_can_be_rebuilt(self):
+        self.follow(self.author)
+        for index in range(4):
+            self.post(self.author, f'Post {index}')
+        self.assertEqual(self.feed_titles(), ['Post 3', 'Post 2'])
+
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed_titles(), ['Post 3', 'Post 2'])
+        self.assertEqual(self.client.get(self.feed_url, {'cursor': 'x'}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class FanoutWorkerTests(APITransactionTestCase):
+    def test_posts_are_fanned_out_in_the_background(self):
+        author, reader = [User.objects.create_user(username=name, password='testpass123')
+                          for name in ('author', 'reader')]
+        Follow.objects.add(reader, author)
+        worker = FanoutWorker()
+        self.addCleanup(worker.stop)
+        posts = [Post.objects.create(user=author, title=f'Post {index}', body='Body')
+                 for index in range(3)]
+        for post in posts:
+            worker.submit(post.id)
+        worker.join()
+        self.assertEqual(TimelineEntry.objects.filter(user=reader).count(), 3)
+
+
+class SearchTests(AuthenticatedClientMixin, APITestCase):
+    with_post = False
+
+    def setUp(self):
+        super().setUp()
+        self.django, self.python, self.garden = Post.objects.bulk_create([
+            Post(user=self.user, title='Django tips', body='Keyset pagination in views'),
+            Post(user=self.user, title='Python packaging', body='Shipping django apps'),
+            Post(user=self.user, title='Gardening', body='Growing tomatoes'),
+        ])
+        self.url = reverse('post-search')
+
+    def search(self, q, **params):
+        titles, url, params = [], self.url, {'q': q, **params}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [post['title'] for post in response.data['results']]
+            url, params = response.data['next'], {}
+        return titles
+
+    def test_results_are_ranked_and_paginated(self):
+        self.assertEqual(self.search('django'), ['Django tips', 'Python packaging'])
+        self.assertEqual(self.search('Django!', page_size=1),
+                         ['Django tips', 'Python packaging'])
+        self.assertEqual(self.search('django shipping'), ['Python packaging'])
+        self.assertEqual(self.search('tomat* grow*'), ['Gardening'])
+        self.assertEqual(self.search('pa*'), ['Python packaging', 'Django tips'])
+        self.assertEqual(self.search('pack*'), ['Python packaging'])
+        self.assertEqual(self.client.get(self.url, {'q': '?!'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_updates_and_deletes(self):
+        Post.objects.filter(pk=self.garden.pk).update(title='Django plants')
+        self.assertEqual(self.search('plant*'), ['Django plants'])
+        self.assertEqual(self.search('gardening'), [])
+        self.django.delete()
+        self.assertEqual(self.search('django'), ['Django plants', 'Python packaging'])
+        Post.objects.filter(pk=self.python.pk).update(like_count=5)
+        self.assertEqual(self.search('packaging'), ['Python packaging'])
+
+
+@override_settings(TRENDING_CACHE_TIMEOUT=0)
+class TrendingTests(AuthenticatedClientMixin, APITestCase):
+    with_post = False
+
+    def setUp(self):
+        super().setUp()
+        self.old, self.new, self.quiet = Post.objects.bulk_create(
+            [Post(user=self.user, title=title, body='Body')
+             for title in ('Old', 'New', 'Quiet')])
+        self.url = reverse('post-trending')
+
+    def trending(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(post['title'], post['trending_score'])
+                for post in response.data['results']]
+
+    def test_recent_likes_outweigh_older_ones(self):
+        # Three likes two half-lives ago are worth 0.75 of a like now
+        liked = timezone.now() - timezone.timedelta(
+            seconds=2 * settings.TRENDING_HALF_LIFE)
+        for _ in range(3):
+            Post.objects.filter(pk=self.old.pk).update(
+                **score_updates([(self.old.pk, liked)], 1))
+        self.client.post(reverse('post-like', args=[self.new.pk]))
+        self.assertEqual(self.trending(), [('New', 1.0), ('Old', 0.75)])
+        self.assertEqual(self.trending(page_size=1), [('New', 1.0)])
+
+        self.client.post(reverse('post-unlike', args=[self.new.pk]))
+        self.assertEqual(self.trending(), [('Old', 0.75)])
+
+    def test_bulk_likes_update_scores(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        Like.objects.add_many(self.user, [self.old.pk, self.new.pk])
+        Like.objects.add_many(other, [self.new.pk])
+        self.assertEqual(self.trending(), [('New', 2.0), ('Old', 1.0)])
+        Like.objects.remove_many(other, [self.new.pk])
+        Like.objects.filter(user=self.user, post=self.old).delete()
+        self.assertEqual(self.trending(), [('New', 1.0)])
+
+    def test_scores_are_rescaled_once_per_epoch(self):
+        epoch = current_epoch()
+        intervals = settings.TRENDING_RESCALE_INTERVAL / settings.TRENDING_HALF_LIFE
+        Post.objects.filter(pk=self.old.pk).update(
+            trending_score=2 ** intervals * 3, trending_epoch=epoch - 1)
+        Post.objects.filter(pk=self.quiet.pk).update(
+            trending_score=settings.TRENDING_MIN_SCORE, trending_epoch=epoch - 1)
+        self.assertEqual([post_id for post_id, _ in trending_posts(10)], [self.old.pk])
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.trending_epoch, epoch)
+        self.assertAlmostEqual(self.old.trending_score, 3)
+        self.assertEqual(Post.objects.filter(trending_score__gt=0).count(), 1)
+
+    def test_rebuild_from_likes(self):
+        Like.objects.add_many(self.user, [self.new.pk])
+        Post.objects.update(trending_score=0)
+        call_command('rebuild_trending', stdout=StringIO())
+        self.assertEqual(self.trending(), [('New', 1.0)])
+
+
+class LikeSeriesTests(AuthenticatedClientMixin, APITestCase):
+    with_post = False
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.first, self.second, self.third = Post.objects.bulk_create(
+            [Post(user=user, title=title, body='Body') for user, title in (
+                (self.user, 'First'), (self.user, 'Second'), (self.other, 'Third'))])
+        # Monday 2024-03-04 at 10:15 UTC
+        start = timezone.make_aware(timezone.datetime(2024, 3, 4, 10, 15))
+        likes = [(self.user, self.first, 0), (self.other, self.first, 0),
+                 (self.user, self.second, 0), (self.other, self.second, 2),
+                 (self.user, self.third, 24 * 7)]
+        Like.objects.bulk_create([
+            Like(user=user, post=post, date=start + timezone.timedelta(hours=hours))
+            for user, post, hours in likes])
+        self.url = reverse('post-analytics-buckets')
+
+    def series(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_hourly_buckets_are_zero_filled(self):
+        data = self.series(date_from='2024-03-04', date_to='2024-03-04',
+                           granularity='hour', top=1)['data']
+        self.assertEqual(len(data), 24)
+        self.assertEqual([bucket['count'] for bucket in data[9:13]], [0, 3, 0, 1])
+        self.assertEqual(data[10]['start'].hour, 10)
+        self.assertEqual(data[10]['top_posts'], [{'post_id': self.first.pk, 'count': 2}])
+        self.assertEqual(data[11]['top_posts'], [])
+
+    def test_weeks_and_months_cover_whole_buckets(self):
+        body = self.series(date_from='2024-03-06', date_to='2024-03-12',
+                           granularity='week', top=2)
+        self.assertEqual((body['date_from'], body['date_to']),
+                         (date(2024, 3, 4), date(2024, 3, 17)))
+        self.assertEqual([bucket['count'] for bucket in body['data']], [4, 1])
+        self.assertEqual(body['data'][0]['top_posts'], [
+            {'post_id': self.first.pk, 'count': 2},
+            {'post_id': self.second.pk, 'count': 2}])
+        data = self.series(date_from='2024-02-10', date_to='2024-03-01',
+                           granularity='month')['data']
+        self.assertEqual([(bucket['start'].month, bucket['count']) for bucket in data],
+                         [(2, 0), (3, 5)])
+        self.assertNotIn('top_posts', data[0])
+
+    def test_post_and_author_filters(self):
+        params = {'date_from': '2024-03-01', 'date_to': '2024-03-31',
+                  'granularity': 'month'}
+        for filters, count in (({'post': self.second.pk}, 2),
+                               ({'author': self.user.pk}, 4),
+                               ({'author': self.other.pk}, 1)):
+            self.assertEqual(self.series(**filters, **params)['data'][0]['count'], count)
+
+    def test_invalid_parameters(self):
+        for params in ({'date_from': '2024-03-01'},
+                       {'date_from': '2024-03-02', 'date_to': '2024-03-01'},
+                       {'date_from': '2024-03-01', 'date_to': '2024-03-01',
+                        'granularity': 'year'},
+                       {'date_from': '2020-01-01', 'date_to': '2024-03-01',
+                        'granularity': 'hour'},
+                       {'date_from': '0001-01-01', 'date_to': '2024-03-01',
+                        'granularity': 'month'},
+                       {'date_from': '2024-03-01', 'date_to': '2024-03-01', 'top': 'x'},
+                       {'date_from': '2024-03-01', 'date_to': '2024-03-01', 'top': '²'},
+                       {'date_from': '2024-03-01', 'date_to': '2024-03-01', 'post': '²'}):
+            self.assertEqual(self.client.get(self.url, params).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+
+class BucketCountsTests(SimpleTestCase):
+    def test_matches_a_naive_count(self):
+        rng = np.random.default_rng(1)
+        edges = bucket_edges(date(2024, 3, 1), date(2024, 3, 31), 'day')
+        start = int(edges[0].timestamp())
+        times = rng.integers(start, int(edges[-1].timestamp()), 5000)
+        post_ids = rng.integers(1, 40, 5000)
+        counts, top_posts = bucket_counts(times, post_ids, edges, top=3)
+
+        days = (times - start) // 86400
+        self.assertEqual(counts, [int((days == day).sum()) for day in range(31)])
+        for day in range(31):
+            per_post = Counter(post_ids[days == day].tolist())
+            expected = sorted(per_post.items(), key=lambda item: (-item[1], item[0]))
+            self.assertEqual(top_posts[day], expected[:3])
+
+
+class UniqueUsersTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        seed(3000, 300, 12000, days=5, seed=11, prefix='unique')
+        call_command('rebuild_like_stats', stdout=StringIO())
+        self.date_to = timezone.localdate()
+        self.date_from = self.date_to - timezone.timedelta(days=5)
+
+    def exact(self, date_from, date_to):
+        return Like.objects.filter(date__date__range=[date_from, date_to])\
+            .values('user_id').distinct().count()
+
+    def test_estimates_are_within_the_error_bound(self):
+        started = time.perf_counter()
+        daily = daily_unique_users(self.date_from, self.date_to)
+        total = unique_users(self.date_from, self.date_to)
+        sketch_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        exact_daily = {day: self.exact(day, day) for day in daily}
+        exact_total = self.exact(self.date_from, self.date_to)
+        exact_seconds = time.perf_counter() - started
+        logging.getLogger('api').debug('Sketches %.3fs, exact counts %.3fs',
+                                       sketch_seconds, exact_seconds)
+        self.assertGreater(len(daily), 1)
+        for day, count in daily.items():
+            self.assertAlmostEqual(count, exact_daily[day],
+                                   delta=3 * STANDARD_ERROR * exact_daily[day] + 1)
+        self.assertAlmostEqual(total, exact_total, delta=3 * STANDARD_ERROR * exact_total)
+        sketches = DailyLikeStats.objects\
+            .filter(post__isnull=True, registers__isnull=False)\
+            .values_list('registers', flat=True)
+        self.assertEqual([len(registers) for registers in sketches],
+                         [REGISTERS] * len(daily))
+
+    def test_large_counts_use_the_raw_estimate(self):
+        ranks = np.zeros(REGISTERS, dtype=np.uint8)
+        for user_id in range(1, 200001):
+            register, rank = register_of(user_id)
+            ranks[register] = max(rank, ranks[register])
+        self.assertEqual(np.count_nonzero(ranks), REGISTERS)
+        count = estimate(ranks)
+        self.assertAlmostEqual(count, 200000, delta=3 * STANDARD_ERROR * 200000)
+
+    def test_likes_update_the_sketch_once_per_user(self):
+        today = timezone.localdate()
+        before = unique_users(today, today)
+        user = User.objects.create_user(username='liker', password='testpass123')
+        self.client.force_authenticate(user)
+        posts = list(Post.objects.values_list('pk', flat=True)[:3])
+        for post_id in posts:
+            self.client.post(reverse('post-like', args=[post_id]))
+        self.assertIn(unique_users(today, today), (before, before + 1))
+        self.client.post(reverse('post-unlike', args=[posts[0]]))
+        self.assertIn(unique_users(today, today), (before, before + 1))
+
+        # The registers raised like by like match a rebuild from the likes
+        sketch = daily_sketches(today, today)[today]
+        call_command('rebuild_like_sketches', stdout=StringIO())
+        self.assertEqual(daily_sketches(today, today)[today].tolist(), sketch.tolist())
+
+    def test_analytics_responses(self):
+        self.client.force_authenticate(User.objects.first())
+        params = {'date_from': self.date_from.isoformat(),
+                  'date_to': self.date_to.isoformat()}
+        body = self.client.get(reverse('post-analytics'), params).data
+        self.assertEqual(body['unique_users'],
+                         unique_users(self.date_from, self.date_to))
+        self.assertEqual(body['unique_users_error'], round(STANDARD_ERROR, 4))
+        daily = daily_unique_users(self.date_from, self.date_to)
+        self.assertEqual({row['date']: row['unique_users'] for row in body['data']},
+                         {day.isoformat(): count for day, count in daily.items()})
+
+        url = reverse('post-analytics-buckets')
+        data = self.client.get(url, {**params, 'granularity': 'day'}).data['data']
+        self.assertEqual([bucket['unique_users'] for bucket in data],
+                         [daily.get(bucket['start'].date(), 0) for bucket in data])
+        post = Like.objects.values_list('post_id', flat=True).first()
+        data = self.client.get(url, {**params, 'post': post}).data['data']
+        self.assertEqual([bucket['unique_users'] for bucket in data],
+                         [bucket['count'] for bucket in data])
+        data = self.client.get(url, {**params, 'granularity': 'hour'}).data['data']
+        self.assertNotIn('unique_users', data[0])
+
+
+class AsyncReadViewTests(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.post] + [
+            Post.objects.create(user=self.user, title=f'Post {index}', body='Body')
+            for index in range(2)]
+        Like.objects.create(user=self.user, post=self.posts[0])
+        self.factory = AsyncRequestFactory()
+
+    def request(self, method, url, data=None, **kwargs):
+        headers = {'authorization': f'Bearer {self.token}'} if self.token else {}
+        return getattr(self.factory, method)(url, data, headers=headers, **kwargs)
+
+    async def test_post_list_matches_sync_view(self):
+        url = reverse('post-list')
+        response = await async_views.post_list(self.request('get', url, {'page_size': 2}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await sync_to_async(self.client.get)(url, {'page_size': 2})
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    async def test_post_detail(self):
+        post = self.posts[0]
+        url = reverse('post-detail', kwargs={'pk': post.pk})
+        response = await async_views.post_detail(self.request('get', url), pk=post.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['like_count'], 1)
+        response = await async_views.post_detail(self.request('get', '/'), pk=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_unauthenticated_requests_are_rejected(self):
+        self.token = None
+        response = await async_views.post_detail(
+            self.request('get', '/'), pk=self.posts[0].pk)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        response = await async_views.post_analytics(self.request('get', '/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        today = timezone.localdate()
+        params = {'date_from': today.isoformat(), 'date_to': today.isoformat()}
+        response = await async_views.post_analytics(self.request('get', '/', params))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(await cache.aget(
+            f'analytics_stale_{today}_{today}_{ANALYTICS_VARIANT}'))
+
+    async def test_analytics_and_activity(self):
+        today = timezone.localdate().isoformat()
+        params = {'date_from': today, 'date_to': today}
+        response = await async_views.post_analytics(self.request('get', '/', params))
+        body = json.loads(response.content)
+        self.assertEqual(body['data'], [{'date': today, 'count': 1, 'unique_users': 1}])
+        self.assertEqual(body['status'], 'Analytics data retrieved successfully')
+        response = await async_views.post_analytics(self.request('get', '/', params))
+        self.assertIn('(from cache)', json.loads(response.content)['status'])
+        response = await async_views.post_analytics(self.request('get', '/'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = await async_views.user_activity(self.request('get', '/'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(json.loads(response.content)['last_request'])
+
+    async def test_other_methods_go_to_the_viewset(self):
+        response = await async_views.post_list(self.request(
+            'post', reverse('post-list'), {'title': 'New', 'body': 'Body'},
+            content_type='application/json'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(await Post.objects.acount(), 4)
+
+    async def test_profiling_middleware_measures_async_requests(self):
+        async def view(request):
+            return HttpResponse(str(await Post.objects.acount()))
+
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = self.request('get', '/')
+        response = await middleware(request)
+        self.assertEqual(response.content, b'3')
+        self.assertIn('api_request_sql_queries_count{view="unresolved",action=""}',
+                      render_metrics())
@@ -0,0 +1,253 @@
+"""
+Like counts bucketed by hour, day, week or month, optionally for one post
+or one author, with the top posts of every bucket.
+
+The likes of the range are read as two integer columns, unix time and post
+id, chunk_size rows at a time into NumPy arrays. Bucketing and grouping
+are then done on the whole arrays at once. Bucket edges are computed in
+the current time zone, so days, weeks and months start at local midnight
+also across DST changes. Buckets without likes are reported with a zero
+count.
+"""
+from datetime import datetime, time, timedelta
+from itertools import chain, pairwise
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import BigIntegerField, Func, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .hyperloglog import daily_sketches, estimate, merge
+from .models import Like
+from .params import date_param, int_param
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+
+class UnixTime(Func):
+    """
+    Whole seconds since the epoch of a datetime column.
+    """
+    template = 'FLOOR(EXTRACT(EPOCH FROM %(expressions)s))'
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Datetimes are stored as UTC text on SQLite
+        if connection.Database.sqlite_version_info >= (3, 38):
+            return Func(*self.get_source_expressions(), function='unixepoch')\
+                .as_sql(compiler, connection, **extra_context)
+        return Cast(Func(Value('%s'), *self.get_source_expressions(),
+                         function='strftime'), BigIntegerField())\
+            .as_sql(compiler, connection, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return Cast(Func(*self.get_source_expressions(), template=self.template),
+                    BigIntegerField()).as_sql(compiler, connection, **extra_context)
+
+
+def series_params(query_params):
+    """
+    Reads the range, granularity and filters of a like series from the
+    query string. date_from and date_to are required and inclusive, and
+    are widened to whole weeks or months for those granularities.
+    :return: dict with date_from, date_to, granularity, post, author and top
+    :raises ValidationError: for missing or invalid values
+    """
+    params = {
+        'date_from': date_param(query_params, 'date_from'),
+        'date_to': date_param(query_params, 'date_to'),
+        'granularity': query_params.get('granularity', 'day'),
+        'post': int_param(query_params, 'post'),
+        'author': int_param(query_params, 'author'),
+        'top': int_param(query_params, 'top') or 0,
+    }
+    for name in ('date_from', 'date_to'):
+        if params[name] is None:
+            raise ValidationError({name: 'This parameter is required.'})
+    if params['date_from'] > params['date_to']:
+        raise ValidationError({'date_to': 'Must not be before date_from.'})
+    if params['granularity'] not in GRANULARITIES:
+        raise ValidationError({'granularity': f'One of {", ".join(GRANULARITIES)}.'})
+    if params['top'] > settings.ANALYTICS_MAX_TOP_POSTS:
+        raise ValidationError(
+            {'top': f'At most {settings.ANALYTICS_MAX_TOP_POSTS}.'})
+    days = (params['date_to'] - params['date_from']).days + 1
+    if days > settings.ANALYTICS_MAX_DAYS:
+        raise ValidationError(
+            {'date_to': f'At most {settings.ANALYTICS_MAX_DAYS} days.'})
+    if params['granularity'] == 'hour' and days * 24 > settings.ANALYTICS_MAX_BUCKETS:
+        raise ValidationError(
+            {'date_to': f'At most {settings.ANALYTICS_MAX_BUCKETS} hourly buckets.'})
+    params['date_from'], params['date_to'] = bucket_range(
+        params['date_from'], params['date_to'], params['granularity'])
+    return params
+
+
+def bucket_range(date_from, date_to, granularity):
+    """
+    Widens the range to whole buckets. Weeks start on Monday, months on
+    the 1st.
+    :return: tuple of the first and the last day
+    """
+    if granularity == 'week':
+        date_from -= timedelta(days=date_from.weekday())
+        date_to += timedelta(days=6 - date_to.weekday())
+    elif granularity == 'month':
+        date_from = date_from.replace(day=1)
+        date_to = _next_month(date_to) - timedelta(days=1)
+    return date_from, date_to
+
+
+def bucket_edges(date_from, date_to, granularity):
+    """
+    :param date_from: date, first day of the range
+    :param date_to: date, last day of the range
+    :param granularity: one of GRANULARITIES
+    :return: list of aware datetimes, the start of every bucket followed by
+        the end of the last one
+    """
+    date_from, date_to = bucket_range(date_from, date_to, granularity)
+    end = date_to + timedelta(days=1)
+    if granularity == 'hour':
+        # Hours are counted in absolute time, as local times can repeat or
+        # be skipped on DST changes
+        start, stop = _day_start(date_from).timestamp(), _day_start(end).timestamp()
+        zone = timezone.get_current_timezone()
+        return [datetime.fromtimestamp(timestamp, zone)
+                for timestamp in range(int(start), int(stop) + 1, 3600)]
+    days = []
+    day = date_from
+    while True:
+        days.append(day)
+        if day >= end:
+            break
+        if granularity == 'day':
+            day += timedelta(days=1)
+        elif granularity == 'week':
+            day += timedelta(days=7)
+        else:
+            day = _next_month(day)
+    return [_day_start(day) for day in days]
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def like_columns(start, end, post=None, author=None, chunk_size=10000):
+    """
+    Reads the unix time and the post id of every like in [start, end).
+    :param start: aware datetime
+    :param end: aware datetime
+    :param post: int, only likes of this post
+    :param author: int, only likes of this user's posts
+    :param chunk_size: int, rows fetched at a time
+    :return: tuple of int64 arrays of unix times and post ids
+    """
+    queryset = Like.objects.filter(date__gte=start, date__lt=end)
+    if post is not None:
+        queryset = queryset.filter(post_id=post)
+    if author is not None:
+        queryset = queryset.filter(post__user_id=author)
+    queryset = queryset.order_by().annotate(unix_time=UnixTime('date'))\
+        .values_list('post_id', 'unix_time')
+    # Rows are read with a plain cursor, as both columns are integers that
+    # need none of the ORM's per-row conversions. Fields come before
+    # annotations in the SELECT, as listed here.
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    chunks = []
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                                      count=2 * len(rows)))
+    columns = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+    return columns[1::2], columns[0::2]
+
+
+def bucket_counts(times, post_ids, edges, top=0):
+    """
+    :param times: int64 array of unix times, all within the edges
+    :param post_ids: int64 array of the post ids of the same likes
+    :param edges: list of aware datetimes from bucket_edges
+    :param top: int, number of top posts to return per bucket
+    :return: tuple of the like count of every bucket, and for every bucket
+        a list of up to top tuples of post id and count, most liked first
+    """
+    buckets = len(edges) - 1
+    bounds = np.array([int(edge.timestamp()) for edge in edges], dtype=np.int64)
+    index = np.searchsorted(bounds, times, side='right') - 1
+    counts = np.bincount(index, minlength=buckets)
+    top_posts = [[] for _ in range(buckets)]
+    if not top or not len(times):
+        return counts.tolist(), top_posts
+
+    # One entry per (bucket, post) pair, then ranked within each bucket by
+    # count, ties going to the older post
+    posts, post_index = np.unique(post_ids, return_inverse=True)
+    pairs, pair_counts = np.unique(index * len(posts) + post_index, return_counts=True)
+    pair_buckets, pair_posts = np.divmod(pairs, len(posts))
+    order = np.lexsort((pair_posts, -pair_counts, pair_buckets))
+    ranked_buckets = pair_buckets[order]
+    rank = np.arange(len(order)) - np.searchsorted(ranked_buckets, ranked_buckets)
+    kept = order[rank < top]
+    for bucket, post_id, count in zip(pair_buckets[kept].tolist(),
+                                      posts[pair_posts[kept]].tolist(),
+                                      pair_counts[kept].tolist()):
+        top_posts[bucket].append((post_id, count))
+    return counts.tolist(), top_posts
+
+
+def bucket_unique_users(edges, granularity):
+    """
+    Estimates the users who liked something in every day, week or month
+    bucket from the daily user sketches.
+    :param edges: list of aware datetimes from bucket_edges
+    :param granularity: day, week or month
+    :return: list of int
+    """
+    days = [edge.date() for edge in edges]
+    sketches = daily_sketches(days[0], days[-2])
+    if granularity == 'day':
+        return [estimate(sketches[day]) if day in sketches else 0
+                for day in days[:-1]]
+    return [estimate(merge(sketch for day, sketch in sketches.items()
+                           if start <= day < end))
+            for start, end in pairwise(days)]
+
+
+def like_series(date_from, date_to, granularity, post=None, author=None, top=0):
+    """
+    :return: list of dicts with the start, count, unique_users and
+        top_posts of every bucket of the range, oldest first; unique_users
+        only for one post or without author and hourly buckets, top_posts
+        only with top
+    """
+    edges = bucket_edges(date_from, date_to, granularity)
+    times, post_ids = like_columns(edges[0], edges[-1], post, author,
+                                   settings.ANALYTICS_CHUNK_SIZE)
+    counts, top_posts = bucket_counts(times, post_ids, edges, top)
+    # Sketches are daily and over all posts. A user likes a post at most
+    # once, so for one post the unique users are its likes.
+    users = None
+    if post is not None:
+        users = counts
+    elif granularity != 'hour' and author is None:
+        users = bucket_unique_users(edges, granularity)
+    series = []
+    for index, (start, count, posts) in enumerate(zip(edges, counts, top_posts)):
+        bucket = {'start': start, 'count': count}
+        if users is not None:
+            bucket['unique_users'] = users[index]
+        if top:
+            bucket['top_posts'] = [{'post_id': post_id, 'count': post_count}
+                                   for post_id, post_count in posts]
+        series.append(bucket)
+    return series
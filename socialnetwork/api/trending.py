@@ -0,0 +1,169 @@
+"""
+Trending posts: posts ranked by their likes, each like counting half as
+much every TRENDING_HALF_LIFE seconds.
+
+Scores use forward decay. A like at time t adds 2 ** ((t - L) / half_life)
+to the post's trending_score, where the landmark L is the start of the
+current epoch of TRENDING_RESCALE_INTERVAL seconds. Scores relative to one
+landmark rank in the same order as the decayed scores and only change on
+likes and unlikes, so ranking is a read of an index on trending_score, and
+its cost does not depend on how many likes there are. An unlike subtracts
+the weight of the like it removes.
+
+Every post records the epoch its score is relative to, and the UPDATE that
+applies a like also brings the score to the current epoch. Once per epoch
+the first trending read rescales the posts that were not liked since, and
+zeroes the scores that decayed below TRENDING_MIN_SCORE. Weights therefore
+stay below 2 ** (interval / half_life), and only recently liked posts stay
+in the index.
+
+The top TRENDING_SIZE posts are kept in the cache for
+TRENDING_CACHE_TIMEOUT seconds.
+"""
+import math
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (Case, ExpressionWrapper, F, FloatField, Value,
+                              When)
+from django.db.models.functions import Exp, Greatest
+
+TRENDING_KEY = 'trending_posts'
+RESCALE_KEY = 'trending_rescaled_{}'
+# exp() below this underflows, which PostgreSQL reports as an error
+MIN_EXPONENT = -700.0
+
+
+def current_epoch(timestamp=None):
+    """
+    :param timestamp: float unix time, now by default
+    :return: int
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    return int(timestamp // settings.TRENDING_RESCALE_INTERVAL)
+
+
+def like_weight(timestamp, epoch):
+    """
+    :param timestamp: float, unix time of the like
+    :param epoch: int
+    :return: float, the weight of the like relative to the epoch's landmark
+    """
+    landmark = epoch * settings.TRENDING_RESCALE_INTERVAL
+    return 2.0 ** ((timestamp - landmark) / settings.TRENDING_HALF_LIFE)
+
+
+def _rescale_factor(epoch):
+    # Brings a score from the row's epoch to the given one
+    rate = settings.TRENDING_RESCALE_INTERVAL * math.log(2) / settings.TRENDING_HALF_LIFE
+    exponent = ExpressionWrapper((F('trending_epoch') - epoch) * Value(rate),
+                                 output_field=FloatField())
+    return Exp(Greatest(exponent, Value(MIN_EXPONENT)))
+
+
+def score_updates(changes, delta):
+    """
+    Builds the Post update() arguments applying likes or unlikes to the
+    trending scores of their posts.
+    :param changes: list of tuples of post id and datetime of the like,
+        without duplicate posts
+    :param delta: 1 for likes, -1 for unlikes
+    :return: dict
+    """
+    epoch = current_epoch()
+    weights = {post_id: delta * like_weight(date.timestamp(), epoch)
+               for post_id, date in changes}
+    if len(set(weights.values())) == 1:
+        weight = Value(next(iter(weights.values())))
+    else:
+        weight = Case(*[When(id=post_id, then=Value(value))
+                        for post_id, value in weights.items()],
+                      output_field=FloatField())
+    return {
+        'trending_score': Greatest(F('trending_score') * _rescale_factor(epoch) + weight,
+                                   Value(0.0)),
+        'trending_epoch': epoch,
+    }
+
+
+def rescale(epoch):
+    """
+    Brings the scores of every post to the epoch and zeroes the ones that
+    decayed below TRENDING_MIN_SCORE.
+    :param epoch: int
+    :return: int, number of posts rescaled
+    """
+    posts = _posts().objects.filter(trending_score__gt=0)
+    with transaction.atomic():
+        rescaled = posts.filter(trending_epoch__lt=epoch).update(
+            trending_score=F('trending_score') * _rescale_factor(epoch),
+            trending_epoch=epoch)
+        posts.filter(trending_score__lt=settings.TRENDING_MIN_SCORE)\
+            .update(trending_score=0.0)
+    return rescaled
+
+
+def rebuild(since, batch_size):
+    """
+    Recomputes the trending scores from the likes made since the given time,
+    for example after a bulk import that bypassed the like counters.
+    :param since: datetime
+    :param batch_size: int
+    :return: int, number of posts with a score
+    """
+    Post, Like = _posts(), apps.get_model('api', 'Like')
+    epoch = current_epoch()
+    scores = defaultdict(float)
+    for post_id, date in Like.objects.filter(date__gte=since)\
+            .values_list('post_id', 'date').iterator(chunk_size=batch_size):
+        scores[post_id] += like_weight(date.timestamp(), epoch)
+    posts = [Post(id=post_id, trending_score=score, trending_epoch=epoch)
+             for post_id, score in scores.items()
+             if score >= settings.TRENDING_MIN_SCORE]
+    with transaction.atomic():
+        Post.objects.filter(trending_score__gt=0).update(trending_score=0.0)
+        Post.objects.bulk_update(posts, ['trending_score', 'trending_epoch'],
+                                 batch_size=batch_size)
+    cache.delete(TRENDING_KEY)
+    return len(posts)
+
+
+def trending_posts(size):
+    """
+    Reads the top posts from the cache, refilling it from the trending
+    index when it expired or the epoch changed. The first refill of an
+    epoch rescales the scores first.
+    :param size: int, at most TRENDING_SIZE
+    :return: list of tuples of post id and decayed score, best first
+    """
+    epoch = current_epoch()
+    entry = cache.get(TRENDING_KEY)
+    if entry is None or entry['epoch'] != epoch:
+        rescale_key = RESCALE_KEY.format(epoch)
+        if cache.add(rescale_key, True, timeout=settings.TRENDING_RESCALE_INTERVAL):
+            try:
+                rescale(epoch)
+            except Exception:
+                cache.delete(rescale_key)
+                raise
+        entry = {'epoch': epoch, 'posts': list(
+            _posts().objects.filter(trending_score__gt=0)
+            .order_by('-trending_score', '-id')
+            .values_list('id', 'trending_score', 'trending_epoch')
+            [:settings.TRENDING_SIZE])}
+        cache.set(TRENDING_KEY, entry, settings.TRENDING_CACHE_TIMEOUT)
+    # Each score is decayed from its own landmark, as posts another process
+    # has not rescaled yet are relative to an older one
+    now = time.time()
+    scores = [(post_id, score / like_weight(now, row_epoch))
+              for post_id, score, row_epoch in entry['posts']]
+    return sorted(scores, key=lambda item: (-item[1], -item[0]))[:size]
+
+
+def _posts():
+    return apps.get_model('api', 'Post')
@@ -1,16 +1,30 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
-from .views import PostViewSet, UserViewSet
+from . import async_views
+from .views import FeedView, PostViewSet, UserViewSet, metrics
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'posts', PostViewSet, basename='post')
 
-urlpatterns = [
+# Under ASGI the read endpoints are served by their async versions, which
+# hand other methods on the same URLs back to the viewsets
+async_urlpatterns = [
+    path('users/activity/', async_views.user_activity),
+    path('posts/', async_views.post_list),
+    path('posts/analytics/', async_views.post_analytics),
+    path('posts/<int:pk>/', async_views.post_detail),
+]
+
+urlpatterns = async_urlpatterns if settings.ASYNC_READ_VIEWS else []
+urlpatterns += [
     path('', include(router.urls)),
+    path('feed/', FeedView.as_view(), name='feed'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics/', metrics, name='metrics'),
 ]
@@ -1,26 +1,201 @@
 import logging
+from functools import partial
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db.models import Count
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import (HttpResponse, HttpResponseForbidden,
+                         StreamingHttpResponse)
 from django.utils import timezone
 from django.utils.timezone import now
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Like, Post
-from .serializers import AnalyticsSerializer, PostSerializer, UserSerializer
+from .activity import last_seen
+from .analytics import cached_range
+from .db import replica_reads
+from .export import (FORMATS, CSVRenderer, NDJSONRenderer, analytics_rows,
+                     astream, export_params, like_rows, stream)
+from .feed import (decode_cursor, encode_cursor, fanout, feed_page, follow,
+                   unfollow)
+from .hyperloglog import STANDARD_ERROR, estimate, merge, unpack
+from .log import SAMPLED
+from .metrics import render_metrics
+from .models import DailyLikeStats, Like, Post
+from .pagination import PostCursorPagination
+from .params import int_param
+from .search import decode_search_cursor, encode_search_cursor, search_posts
+from .serializers import (AnalyticsSerializer, BulkLikeSerializer,
+                          PostSerializer, UserSerializer)
+from .timeseries import like_series, series_params
+from .trending import trending_posts
 
 logger = logging.getLogger('api')
 User = get_user_model()
 
+EXPORT_PARAMETERS = [
+    openapi.Parameter('format', openapi.IN_QUERY,
+                      description="'ndjson' (default) or 'csv', also negotiable "
+                                  "with the Accept header",
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter('date_from', openapi.IN_QUERY,
+                      description="First day in YYYY-MM-DD format",
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter('date_to', openapi.IN_QUERY,
+                      description="Last day in YYYY-MM-DD format",
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter('post', openapi.IN_QUERY,
+                      description="Only export rows of this post id",
+                      type=openapi.TYPE_INTEGER),
+    openapi.Parameter('user', openapi.IN_QUERY,
+                      description="Only export rows of this user id",
+                      type=openapi.TYPE_INTEGER),
+    openapi.Parameter('cursor', openapi.IN_QUERY,
+                      description="Resume after the row with this id",
+                      type=openapi.TYPE_INTEGER),
+]
 
-class UserViewSet(viewsets.ModelViewSet):
+LIKE_RESPONSE_PARAMETER = openapi.Parameter(
+    'response', openapi.IN_QUERY,
+    description="Use 'compact' to get only post_id, liked and like_count",
+    type=openapi.TYPE_STRING)
+
+
+def metrics(request):
+    """
+    Internal Prometheus endpoint with the request profiling histograms and
+    the cache tier counters. Only reachable from METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    lines = []
+    for name, value in getattr(cache, 'stats', dict)().items():
+        lines += [f'# TYPE api_cache_{name} gauge', f'api_cache_{name} {value}']
+    return HttpResponse(render_metrics(lines),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def analytics_date_range(query_params):
+    """
+    Reads the analytics date range from the query string.
+    :return: tuple of date_from and date_to
+    :raises ValueError: with the error message for the client
+    """
+    date_from = query_params.get('date_from')
+    date_to = query_params.get('date_to')
+    if not date_from or not date_to:
+        logger.error("Analytics request missing date_from or date_to parameters")
+        raise ValueError("date_from and date_to are required parameters")
+    try:
+        date_from = timezone.datetime.strptime(date_from, '%Y-%m-%d').date()
+        date_to = timezone.datetime.strptime(date_to, '%Y-%m-%d').date()
+    except ValueError as e:
+        logger.error("Error parsing dates: %s", e)
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.") from e
+    max_days = settings.ANALYTICS_MAX_DAYS
+    if (date_to - date_from).days >= max_days:
+        raise ValueError(f"The range can span at most {max_days} days.")
+    return date_from, date_to
+
+
+def export_response(request, rows, name):
+    """
+    Streams the rows selected by the export query parameters.
+    :param rows: export.like_rows or export.analytics_rows
+    :param name: file name without extension
+    :return: StreamingHttpResponse
+    """
+    params = export_params(request.query_params)
+    columns, queryset = rows(params)
+    with replica_reads():
+        # Resolve the database now, the rows are read after the view returns
+        queryset = queryset.using(queryset.db)
+    export_format = FORMATS[request.accepted_renderer.format](columns)
+    if isinstance(request._request, ASGIRequest):
+        content = astream(export_format, queryset, settings.EXPORT_CHUNK_SIZE)
+    else:
+        content = stream(export_format, queryset, settings.EXPORT_CHUNK_SIZE)
+    logger.info("Export of %s started with %s", name, params)
+    filename = f'{name}.{export_format.extension}'
+    return StreamingHttpResponse(
+        content, content_type=export_format.content_type, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            # Stops nginx from buffering the whole export before sending it
+            'X-Accel-Buffering': 'no',
+        })
+
+
+# Keeps the cached analytics apart from entries cached before they carried
+# unique_users
+ANALYTICS_VARIANT = 'unique_users'
+
+
+def analytics_data(date_from, date_to):
+    # Counts and user sketches come from the same total rows. Days without
+    # likes left are not listed, but their users still count for the range.
+    rows = DailyLikeStats.objects.filter(
+        post__isnull=True, day__range=[date_from, date_to])\
+        .order_by('day')\
+        .values_list('day', 'count', 'registers')
+    likes_data = []
+    sketches = []
+    for day, count, registers in rows:
+        sketch = unpack(registers)
+        sketches.append(sketch)
+        if count > 0:
+            likes_data.append({'day': day, 'count': count,
+                               'unique_users': estimate(sketch)})
+    return {
+        'data': AnalyticsSerializer(likes_data, many=True).data,
+        'unique_users': estimate(merge(sketches)),
+        'unique_users_error': round(STANDARD_ERROR, 4),
+    }
+
+
+def analytics_body(data, from_cache):
+    """
+    :param data: dict with the analytics under 'data' and any other fields
+        of the response
+    :return: dict
+    """
+    if from_cache:
+        logger.info("Analytics data retrieved from cache", extra=SAMPLED)
+        return {
+            'status': 'Analytics data retrieved successfully (from cache)',
+            **data
+        }
+    logger.info("Analytics data retrieved successfully", extra=SAMPLED)
+    return {
+        'status': 'Analytics data retrieved successfully',
+        **data
+    }
+
+
+class LastSeenMixin:
+    """
+    Records the request time of authenticated users in the write-behind
+    last_seen buffer instead of saving the user row on every request. The
+    request's user carries that time as last_request, since the buffer
+    may already have been flushed by the time a view reads it.
+    """
+
+    def perform_authentication(self, request):
+        user = request.user
+        if user.is_authenticated:
+            user.last_request = now()
+            last_seen.touch(user.pk, user.last_request)
+
+
+class UserViewSet(LastSeenMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
@@ -35,12 +210,12 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            logger.info(f"User created successfully: {user.username}")
+            logger.info("User created successfully: %s", user.username)
             return Response({
                 'status': 'User created successfully',
                 'user': UserSerializer(user).data
             }, status=status.HTTP_201_CREATED)
-        logger.error(f"Signup failed: {serializer.errors}")
+        logger.error("Signup failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @swagger_auto_schema(
@@ -64,14 +239,14 @@ class UserViewSet(viewsets.ModelViewSet):
         user = User.objects.filter(username=username).first()
         if user and user.verify_password(password):
             refresh = RefreshToken.for_user(user)
-            logger.info(f"Login successful for user: {username}")
+            logger.info("Login successful for user: %s", username)
             return Response({
                 'status': 'Login successful',
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
                 'user': UserSerializer(user).data
             })
-        logger.warning(f"Authentication failed for user: {username}")
+        logger.warning("Authentication failed for user: %s", username)
         return Response({'error': 'Invalid credentials'},
                         status=status.HTTP_401_UNAUTHORIZED)
 
@@ -95,22 +270,112 @@ class UserViewSet(viewsets.ModelViewSet):
             'last_request': user.last_request,
         })
 
-    def perform_authentication(self, request):
-        user = request.user
-        if not user.is_authenticated:
-            return
-        user.last_request = now()
-        user.save()
+    @swagger_auto_schema(
+        operation_description="Follow a user",
+        responses={
+            200: openapi.Response(description="User followed successfully"),
+            400: openapi.Response(description="Already following, or following yourself")
+        }
+    )
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def follow(self, request, pk=None):
+        followee = self.get_object()
+        if followee.pk == request.user.pk:
+            return Response({'error': 'You cannot follow yourself'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not follow(request.user, followee):
+            return Response({'error': 'Already following'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        logger.info("User %s followed user %s", request.user.username,
+                    followee.username, extra=SAMPLED)
+        return Response({'status': 'User followed successfully', 'user_id': followee.pk})
+
+    @swagger_auto_schema(
+        operation_description="Unfollow a user",
+        responses={
+            200: openapi.Response(description="User unfollowed successfully"),
+            400: openapi.Response(description="Not following")
+        }
+    )
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def unfollow(self, request, pk=None):
+        followee = self.get_object()
+        if not unfollow(request.user, followee):
+            return Response({'error': 'Not following'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        logger.info("User %s unfollowed user %s", request.user.username,
+                    followee.username, extra=SAMPLED)
+        return Response({'status': 'User unfollowed successfully',
+                         'user_id': followee.pk})
+
+
+class FeedView(LastSeenMixin, APIView):
+    """
+    Posts of the users the requesting user follows, newest first, read from
+    the precomputed home timeline.
+    """
+    permission_classes = [IsAuthenticated]
 
+    @swagger_auto_schema(
+        operation_description="Home feed: posts of followed users, newest first",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY,
+                              description="Cursor from the next link",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY,
+                              description="Posts per page, at most 100",
+                              type=openapi.TYPE_INTEGER),
+        ]
+    )
+    def get(self, request):
+        size = PostCursorPagination().get_page_size(request)
+        position = decode_cursor(request.query_params.get('cursor'))
+        with replica_reads():
+            posts = feed_page(request.user, position, size)
+        next_url = None
+        if len(posts) > size:
+            posts = posts[:size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                           encode_cursor(posts[-1]))
+        return Response({
+            'next': next_url,
+            'results': PostSerializer(posts, many=True).data
+        })
 
-class PostViewSet(viewsets.ModelViewSet):
+
+class PostViewSet(LastSeenMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PostCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            user_id = int_param(self.request.query_params, 'user')
+            if user_id is not None:
+                queryset = queryset.filter(user_id=user_id)
+        return queryset
+
+    @swagger_auto_schema(
+        operation_description="List posts, newest first, with cursor pagination",
+        manual_parameters=[
+            openapi.Parameter('user', openapi.IN_QUERY,
+                              description="Only return posts of this user id",
+                              type=openapi.TYPE_INTEGER),
+            openapi.Parameter('ordering', openapi.IN_QUERY,
+                              description="Use 'popular' to sort by like count",
+                              type=openapi.TYPE_STRING),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         post = serializer.save(user=self.request.user)
-        logger.info(f"Post created successfully by user: {self.request.user.username}")
+        transaction.on_commit(lambda: fanout.submit(post.id))
+        logger.info("Post created successfully by user: %s", self.request.user.username)
         return Response({
             'status': 'Post created successfully',
             'post': PostSerializer(post).data
@@ -118,6 +383,7 @@ class PostViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_description="Like a post",
+        manual_parameters=[LIKE_RESPONSE_PARAMETER],
         responses={
             200: openapi.Response(description="Post liked successfully"),
             400: openapi.Response(description="Post already liked")
@@ -129,6 +395,7 @@ class PostViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_description="Unlike a post",
+        manual_parameters=[LIKE_RESPONSE_PARAMETER],
         responses={
             200: openapi.Response(description="Post unliked successfully"),
             400: openapi.Response(description="Post not liked yet")
@@ -141,36 +408,96 @@ class PostViewSet(viewsets.ModelViewSet):
     def _like_unlike_post(self, request, pk, like=True):
         post = self.get_object()
         user = request.user
-        like_instance, created = Like.objects.get_or_create(user=user, post=post)
         if like:
-            if created:
-                logger.info(f"Post liked successfully: {
-                            post.id} by user: {user.username}")
-                return Response({
-                    'status': 'Post liked successfully',
-                    'post': PostSerializer(post).data,
-                    'user': UserSerializer(user).data
-                }, status=status.HTTP_200_OK)
-            logger.warning(f"Post already liked: {post.id} by user: {user.username}")
-            return Response({
-                'status': 'Post already liked',
-                'post': PostSerializer(post).data,
-                'user': UserSerializer(user).data
-            }, status=status.HTTP_400_BAD_REQUEST)
-        if not created:
-            like_instance.delete()
-            logger.info(f"Post unliked successfully: {post.id} by user: {user.username}")
+            changed = bool(Like.objects.add_many(user, [post.id]))
+        else:
+            changed = bool(Like.objects.remove_many(user, [post.id]))
+        post.refresh_from_db(fields=['like_count'])
+        if like:
+            if changed:
+                logger.info("Post liked successfully: %s by user: %s",
+                            post.id, user.username, extra=SAMPLED)
+                return self._like_response(
+                    request, post, 'Post liked successfully', True, status.HTTP_200_OK)
+            logger.warning("Post already liked: %s by user: %s", post.id, user.username)
+            return self._like_response(
+                request, post, 'Post already liked', True, status.HTTP_400_BAD_REQUEST)
+        if changed:
+            logger.info("Post unliked successfully: %s by user: %s",
+                        post.id, user.username, extra=SAMPLED)
+            return self._like_response(
+                request, post, 'Post unliked successfully', False, status.HTTP_200_OK)
+        logger.warning("Post not liked yet: %s by user: %s", post.id, user.username)
+        return self._like_response(
+            request, post, 'Post not liked yet', False, status.HTTP_400_BAD_REQUEST)
+
+    def _like_response(self, request, post, message, liked, status_code):
+        """
+        Builds the like/unlike response. Clients asking for the compact
+        profile, with ?response=compact or an Accept header carrying
+        profile=compact, get the new state only instead of the serialized
+        post and user.
+        """
+        if (request.query_params.get('response') == 'compact'
+                or 'profile=compact' in request.META.get('HTTP_ACCEPT', '')):
             return Response({
-                'status': 'Post unliked successfully',
-                'post': PostSerializer(post).data,
-                'user': UserSerializer(user).data
-            }, status=status.HTTP_200_OK)
-        logger.warning(f"Post not liked yet: {post.id} by user: {user.username}")
+                'post_id': post.id,
+                'liked': liked,
+                'like_count': post.like_count
+            }, status=status_code)
         return Response({
-            'status': 'Post not liked yet',
+            'status': message,
             'post': PostSerializer(post).data,
-            'user': UserSerializer(user).data
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'user': UserSerializer(request.user).data
+        }, status=status_code)
+
+    @swagger_auto_schema(
+        operation_description="Like or unlike many posts in one request",
+        request_body=BulkLikeSerializer,
+        responses={
+            200: openapi.Response(
+                description="Result for every item, in request order",
+                examples={"application/json": {"results": [
+                    {"post_id": 1, "action": "like", "result": "liked"},
+                    {"post_id": 2, "action": "unlike", "result": "not_liked"}]}}
+            ),
+            400: openapi.Response(description="Invalid items")
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='likes/bulk',
+            permission_classes=[IsAuthenticated])
+    def bulk_like(self, request):
+        serializer = BulkLikeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        items = serializer.validated_data['items']
+        user = request.user
+
+        # The last action for a post wins when it is sent more than once
+        actions = {item['post_id']: item['action'] for item in items}
+        existing = set(Post.objects.filter(id__in=actions)
+                       .values_list('id', flat=True))
+        liked = Like.objects.add_many(user, [
+            post_id for post_id, item_action in actions.items()
+            if item_action == 'like' and post_id in existing])
+        unliked = Like.objects.remove_many(user, [
+            post_id for post_id, item_action in actions.items()
+            if item_action == 'unlike' and post_id in existing])
+
+        results = []
+        for item in items:
+            post_id = item['post_id']
+            if post_id not in existing:
+                result = 'not_found'
+            elif item['action'] == 'like':
+                result = 'liked' if post_id in liked else 'already_liked'
+            else:
+                result = 'unliked' if post_id in unliked else 'not_liked'
+            results.append({'post_id': post_id, 'action': item['action'],
+                            'result': result})
+        logger.info("Bulk likes applied by user: %s, liked: %s, unliked: %s",
+                    user.username, len(liked), len(unliked), extra=SAMPLED)
+        return Response({'results': results}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
         operation_description="Retrieve analytics data for likes between two dates",
@@ -186,37 +513,132 @@ class PostViewSet(viewsets.ModelViewSet):
     )
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def analytics(self, request):
-        date_from = request.query_params.get('date_from')
-        date_to = request.query_params.get('date_to')
-        cache_key = f'analytics_{date_from}_{date_to}'
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            logger.info("Analytics data retrieved from cache")
-            return Response({
-                'status': 'Analytics data retrieved successfully (from cache)',
-                'data': cached_data
-            })
-
-        if not date_from or not date_to:
-            logger.error("Analytics request missing date_from or date_to parameters")
-            return Response({"error": "date_from and date_to are required parameters"},
-                            status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            date_from = timezone.datetime.strptime(date_from, '%Y-%m-%d').date()
-            date_to = timezone.datetime.strptime(date_to, '%Y-%m-%d').date()
-
-            likes_data = Like.objects.filter(date__date__range=[date_from, date_to])\
-                .values('date__date')\
-                .annotate(count=Count('public_id'))
-            serializer = AnalyticsSerializer(likes_data, many=True)
-            logger.info("Analytics data retrieved successfully")
-            cache.set(cache_key, serializer.data, timeout=60*60)
-            return Response({
-                'status': 'Analytics data retrieved successfully',
-                'data': serializer.data
-            })
+            date_from, date_to = analytics_date_range(request.query_params)
         except ValueError as e:
-            logger.error(f"Error parsing dates: {e}")
-            return Response({"error": "Invalid date format. Use YYYY-MM-DD."},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with replica_reads():
+            data, from_cache = cached_range(
+                date_from, date_to, partial(analytics_data, date_from, date_to),
+                ANALYTICS_VARIANT)
+        return Response(analytics_body(data, from_cache))
+
+    @swagger_auto_schema(
+        operation_description="Like counts per hour, day, week or month, optionally "
+                              "for one post or author, with the top posts of every "
+                              "bucket",
+        manual_parameters=[
+            openapi.Parameter('date_from', openapi.IN_QUERY,
+                              description="First day in YYYY-MM-DD format",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('date_to', openapi.IN_QUERY,
+                              description="Last day in YYYY-MM-DD format",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('granularity', openapi.IN_QUERY,
+                              description="'hour', 'day' (default), 'week' or 'month'",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('post', openapi.IN_QUERY,
+                              description="Only count likes of this post id",
+                              type=openapi.TYPE_INTEGER),
+            openapi.Parameter('author', openapi.IN_QUERY,
+                              description="Only count likes of this user id's posts",
+                              type=openapi.TYPE_INTEGER),
+            openapi.Parameter('top', openapi.IN_QUERY,
+                              description="Also return this many most liked posts "
+                                          "per bucket",
+                              type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=['get'], url_path='analytics/buckets',
+            permission_classes=[IsAuthenticated])
+    def analytics_buckets(self, request):
+        params = series_params(request.query_params)
+        variant = '|'.join(f'{name}={params[name]}'
+                           for name in ('granularity', 'post', 'author', 'top'))
+        with replica_reads():
+            data, from_cache = cached_range(
+                params['date_from'], params['date_to'],
+                partial(like_series, **params), variant)
+        body = analytics_body({'data': data}, from_cache)
+        body.update(granularity=params['granularity'],
+                    date_from=params['date_from'], date_to=params['date_to'])
+        return Response(body)
+
+    @swagger_auto_schema(
+        operation_description="Stream the raw likes as NDJSON or CSV, in id order",
+        manual_parameters=EXPORT_PARAMETERS,
+        responses={200: openapi.Response(
+            description="Rows of id, post_id, user_id, date")}
+    )
+    @action(detail=False, methods=['get'], url_path='likes/export',
+            permission_classes=[IsAdminUser],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export_likes(self, request):
+        return export_response(request, like_rows, 'likes')
+
+    @swagger_auto_schema(
+        operation_description="Stream the daily like counts per post as NDJSON or CSV",
+        manual_parameters=EXPORT_PARAMETERS,
+        responses={200: openapi.Response(
+            description="Rows of id, date, post_id, count")}
+    )
+    @action(detail=False, methods=['get'], url_path='analytics/export',
+            permission_classes=[IsAdminUser],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export_analytics(self, request):
+        return export_response(request, analytics_rows, 'analytics')
+
+    @swagger_auto_schema(
+        operation_description="Search post titles and bodies, best matches first",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY,
+                              description="Words that must all match; end a word "
+                                          "with * to match it as a prefix",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('cursor', openapi.IN_QUERY,
+                              description="Cursor from the next link",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY,
+                              description="Posts per page, at most 100",
+                              type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        size = self.paginator.get_page_size(request)
+        position = decode_search_cursor(request.query_params.get('cursor'))
+        with replica_reads():
+            using = Post.objects.db
+            matches = search_posts(request.query_params.get('q'), position, size, using)
+            posts = Post.objects.using(using).in_bulk([post_id for post_id, _ in matches])
+        next_url = None
+        if len(matches) > size:
+            matches = matches[:size]
+            post_id, score = matches[-1]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                           encode_search_cursor(score, post_id))
+        return Response({
+            'next': next_url,
+            'results': PostSerializer([posts[post_id] for post_id, _ in matches
+                                       if post_id in posts], many=True).data
+        })
+
+    @swagger_auto_schema(
+        operation_description="Posts with the most recent likes, each like counting "
+                              "half as much every TRENDING_HALF_LIFE seconds",
+        manual_parameters=[
+            openapi.Parameter('page_size', openapi.IN_QUERY,
+                              description="Number of posts, at most 100",
+                              type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def trending(self, request):
+        size = min(self.paginator.get_page_size(request), settings.TRENDING_SIZE)
+        with replica_reads():
+            scores = trending_posts(size)
+            posts = Post.objects.in_bulk([post_id for post_id, _ in scores])
+        return Response({'results': [
+            {**PostSerializer(posts[post_id]).data, 'trending_score': round(score, 3)}
+            for post_id, score in scores if post_id in posts]})
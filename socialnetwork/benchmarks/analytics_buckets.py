@@ -0,0 +1,91 @@
+"""
+Compares the NumPy like series of /api/posts/analytics/buckets/ with the
+same series computed by ORM aggregation: one GROUP BY on the truncated date
+for the counts and one GROUP BY on date and post for the top posts. Both
+read the database configured by DB_NAME, seeded beforehand:
+
+    DB_NAME=/tmp/likes.sqlite3 python manage.py migrate
+    DB_NAME=/tmp/likes.sqlite3 python manage.py seed --users 10000 \\
+        --posts 100000 --likes 1000000 --days 30 --skip-counters
+    DB_NAME=/tmp/likes.sqlite3 python -m benchmarks.analytics_buckets --days 30
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "socialnetwork.settings")
+django.setup()
+
+from django.db.models import Count  # noqa: E402
+from django.db.models.functions import Trunc  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from api.models import Like  # noqa: E402
+from api.timeseries import bucket_edges, like_series  # noqa: E402
+
+
+def orm_series(date_from, date_to, granularity, top):
+    edges = bucket_edges(date_from, date_to, granularity)
+    likes = Like.objects.filter(date__gte=edges[0], date__lt=edges[-1])\
+        .annotate(bucket=Trunc('date', granularity)).order_by()
+    counts = dict(likes.values_list('bucket').annotate(count=Count('pk')))
+    per_post = defaultdict(list)
+    for bucket, post_id, count in likes.values_list('bucket', 'post_id')\
+            .annotate(count=Count('pk')).iterator():
+        per_post[bucket].append((post_id, count))
+    return [{'start': start, 'count': counts.get(start, 0),
+             'top_posts': sorted(per_post[start],
+                                 key=lambda item: (-item[1], item[0]))[:top]}
+            for start in edges[:-1]]
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run(days, top, repeat, granularities):
+    date_to = timezone.localdate()
+    date_from = date_to - timezone.timedelta(days=days - 1)
+    likes = Like.objects.filter(date__date__gte=date_from).count()
+    results = {}
+    for granularity in granularities:
+        engine, engine_seconds = timed(
+            lambda: like_series(date_from, date_to, granularity, top=top), repeat)
+        orm, orm_seconds = timed(
+            lambda: orm_series(date_from, date_to, granularity, top), repeat)
+        assert [bucket['count'] for bucket in engine] == \
+            [bucket['count'] for bucket in orm], granularity
+        results[granularity] = {
+            'buckets': len(engine),
+            'numpy_seconds': round(engine_seconds, 3),
+            'orm_seconds': round(orm_seconds, 3),
+            'speedup': round(orm_seconds / engine_seconds, 2),
+        }
+    return {'likes': likes, 'days': days, 'top': top, 'granularities': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--granularity', action='append', dest='granularities',
+                        choices=['hour', 'day', 'week', 'month'])
+    args = parser.parse_args()
+    print(json.dumps(run(args.days, args.top, args.repeat,
+                         args.granularities or ['hour', 'day', 'week', 'month']),
+                     indent=4))
+
+
+if __name__ == '__main__':
+    main()
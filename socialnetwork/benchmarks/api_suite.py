@@ -0,0 +1,231 @@
+"""
+In-process API benchmark suite. Seeds a data tier, drives every endpoint
+through the Django test client and fails when an endpoint exceeds its SQL
+query budget or runs more queries than the saved baseline. Latency over
+the p95 budget or regressed against the baseline is only reported, as
+wall-clock timings are too noisy to fail a run on. Results are written to
+benchmarks/results/<tier>.json.
+
+    python manage.py test benchmarks.api_suite
+    BENCH_TIER=small BENCH_UPDATE_BASELINE=1 python manage.py test benchmarks.api_suite
+
+BENCH_TIER picks the data volume (tiny, small, medium, large), BENCH_ROUNDS
+the number of timed requests per endpoint. BENCH_STRICT_LATENCY=1 fails the
+run on latency too, for quiet dedicated machines.
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import ApiUser, Post
+
+TIERS = {
+    'tiny': {'users': 100, 'posts': 1_000, 'likes': 10_000},
+    'small': {'users': 1_000, 'posts': 10_000, 'likes': 100_000},
+    'medium': {'users': 10_000, 'posts': 100_000, 'likes': 1_000_000},
+    'large': {'users': 100_000, 'posts': 1_000_000, 'likes': 10_000_000},
+}
+
+# Per endpoint: most SQL queries one request may run, and the p95 latency
+# in milliseconds it must stay under. Unlikes in a bulk request touch the
+# rollup once per distinct like date, hence the larger bulk budget.
+BUDGETS = {
+    'posts_list': {'queries': 3, 'p95_ms': 150},
+    'posts_list_deep': {'queries': 3, 'p95_ms': 150},
+    'posts_retrieve': {'queries': 3, 'p95_ms': 50},
+    'posts_popular': {'queries': 3, 'p95_ms': 150},
+    'like': {'queries': 12, 'p95_ms': 100},
+    'unlike': {'queries': 12, 'p95_ms': 100},
+    'bulk_like': {'queries': 40, 'p95_ms': 250},
+    'analytics_cold': {'queries': 3, 'p95_ms': 250},
+    'analytics_warm': {'queries': 2, 'p95_ms': 50},
+    'activity': {'queries': 2, 'p95_ms': 50},
+}
+
+# A p95 above baseline * REGRESSION_TOLERANCE + REGRESSION_SLACK_MS is
+# reported as a regression; the absolute slack keeps timer noise on fast
+# endpoints out of the report
+REGRESSION_TOLERANCE = 1.5
+REGRESSION_SLACK_MS = 5
+BENCHMARK_DIR = Path(__file__).resolve().parent
+
+
+def summarize(timings, queries):
+    timings = sorted(timings)
+    return {
+        'rounds': len(timings),
+        'queries': max(queries),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[int(0.95 * (len(timings) - 1))] * 1000, 3),
+        'p99_ms': round(timings[int(0.99 * (len(timings) - 1))] * 1000, 3),
+    }
+
+
+class ApiBenchmark(TestCase):
+    tier = os.environ.get('BENCH_TIER', 'tiny')
+    rounds = int(os.environ.get('BENCH_ROUNDS', 50))
+    strict_latency = os.environ.get('BENCH_STRICT_LATENCY') == '1'
+
+    @classmethod
+    def setUpTestData(cls):
+        started = time.perf_counter()
+        call_command('seed', **TIERS[cls.tier], prefix='bench',
+                     stdout=open(os.devnull, 'w'))
+        cls.seed_seconds = time.perf_counter() - started
+        cls.user = ApiUser.objects.order_by('public_id').first()
+        cls.post_ids = list(Post.objects.values_list('id', flat=True)[:1000])
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+        cls.latency_warnings = []
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._write_results()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.rng = random.Random(1)
+
+    def measure(self, name, request, before=None):
+        """
+        Times request() self.rounds times, records the result and checks it
+        against the budget and the baseline: query counts always, latency
+        only with strict_latency.
+        """
+        timings, queries = [], []
+        for _ in range(self.rounds):
+            if before:
+                before()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request()
+                timings.append(time.perf_counter() - started)
+            self.assertLess(response.status_code, 500, response.content[:500])
+            queries.append(len(context.captured_queries))
+        result = self.results[name] = summarize(timings, queries)
+
+        budget = BUDGETS[name]
+        self.assertLessEqual(result['queries'], budget['queries'],
+                             f'{name} exceeded its query budget')
+        warnings = []
+        if result['p95_ms'] > budget['p95_ms']:
+            warnings.append(f'{name} exceeded its p95 latency budget: '
+                            f'{result["p95_ms"]} > {budget["p95_ms"]} ms')
+        baseline = self._baseline().get('endpoints', {}).get(name)
+        if baseline and not os.environ.get('BENCH_UPDATE_BASELINE'):
+            self.assertLessEqual(result['queries'], baseline['queries'],
+                                 f'{name} runs more queries than the baseline')
+            limit = baseline['p95_ms'] * REGRESSION_TOLERANCE + REGRESSION_SLACK_MS
+            if result['p95_ms'] > limit:
+                warnings.append(f'{name} p95 regressed against the baseline: '
+                                f'{result["p95_ms"]} > {limit:.3f} ms')
+        if self.strict_latency:
+            self.assertEqual(warnings, [])
+        for warning in warnings:
+            print(f'WARNING {warning}', file=sys.stderr)
+        self.latency_warnings.extend(warnings)
+
+    def test_posts_list(self):
+        url = reverse('post-list')
+        self.measure('posts_list', lambda: self.client.get(url))
+        deep = self.client.get(url, {'page_size': 100})
+        for _ in range(5):
+            if deep.data['next']:
+                deep = self.client.get(deep.data['next'])
+        cursor_url = deep.data['next'] or url
+        self.measure('posts_list_deep', lambda: self.client.get(cursor_url))
+        self.measure('posts_popular',
+                     lambda: self.client.get(url, {'ordering': 'popular'}))
+
+    def test_posts_retrieve(self):
+        self.measure('posts_retrieve', lambda: self.client.get(
+            reverse('post-detail', kwargs={'pk': self.rng.choice(self.post_ids)})))
+
+    def test_like_unlike(self):
+        post_ids = iter(self.rng.sample(self.post_ids, self.rounds))
+        liked = []
+
+        def like():
+            liked.append(next(post_ids))
+            return self.client.post(reverse('post-like', kwargs={'pk': liked[-1]}))
+        self.measure('like', like)
+        unliked = iter(liked)
+        self.measure('unlike', lambda: self.client.post(
+            reverse('post-unlike', kwargs={'pk': next(unliked)})))
+
+    def test_bulk_like(self):
+        url = reverse('post-bulk-like')
+
+        def bulk():
+            items = [{'post_id': post_id, 'action': self.rng.choice(['like', 'unlike'])}
+                     for post_id in self.rng.sample(self.post_ids, 20)]
+            return self.client.post(url, {'items': items}, format='json')
+        self.measure('bulk_like', bulk)
+
+    def test_analytics(self):
+        url = reverse('post-analytics')
+        today = timezone.localdate()
+        params = {'date_from': (today - timezone.timedelta(days=30)).isoformat(),
+                  'date_to': today.isoformat()}
+        self.measure('analytics_cold', lambda: self.client.get(url, params),
+                     before=cache.clear)
+        self.client.get(url, params)
+        self.measure('analytics_warm', lambda: self.client.get(url, params))
+
+    def test_activity(self):
+        url = reverse('user-activity')
+        self.measure('activity', lambda: self.client.get(url))
+
+    @classmethod
+    def _baseline(cls):
+        path = BENCHMARK_DIR / 'baselines' / f'{cls.tier}.json'
+        if not path.exists():
+            return {}
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+
+    @classmethod
+    def _write_results(cls):
+        report = {
+            'tier': cls.tier,
+            'volume': TIERS[cls.tier],
+            'seed_seconds': round(getattr(cls, 'seed_seconds', 0), 2),
+            'endpoints': dict(sorted(cls.results.items())),
+        }
+        baseline = cls._baseline().get('endpoints', {})
+        report['diff'] = {
+            name: {'p95_ms': round(result['p95_ms'] - baseline[name]['p95_ms'], 3),
+                   'queries': result['queries'] - baseline[name]['queries']}
+            for name, result in cls.results.items() if name in baseline
+        }
+        report['latency_warnings'] = cls.latency_warnings
+        directories = ['results']
+        if os.environ.get('BENCH_UPDATE_BASELINE'):
+            directories.append('baselines')
+        for directory in directories:
+            path = BENCHMARK_DIR / directory / f'{cls.tier}.json'
+            path.parent.mkdir(exist_ok=True)
+            with open(path, 'w') as output_file:
+                json.dump(report, output_file, indent=4)
+                output_file.write('\n')
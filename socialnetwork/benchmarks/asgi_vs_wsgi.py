@@ -0,0 +1,170 @@
+"""
+Compares read throughput of the WSGI setup (gunicorn sync workers serving
+the DRF viewsets) with the ASGI setup (uvicorn workers serving the async
+read views). Both servers run against the same seeded SQLite database and
+get the same closed-loop mix of activity, post list, post retrieve and
+analytics requests. Prints requests/sec and latency percentiles per server
+as JSON and writes them to benchmarks/results/asgi_vs_wsgi.json.
+
+    python -m benchmarks.asgi_vs_wsgi --workers 4 --concurrency 64 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BENCHMARK_DIR.parent
+
+SERVERS = {
+    'wsgi': ['gunicorn', 'socialnetwork.wsgi:application', '--bind', '127.0.0.1:{port}',
+             '--workers', '{workers}', '--threads', '{threads}'],
+    'asgi': ['uvicorn', 'socialnetwork.asgi:application', '--port', '{port}',
+             '--workers', '{workers}', '--log-level', 'warning'],
+}
+
+# Relative weights of the read endpoints in the request mix
+MIX = {'activity': 1, 'posts_list': 4, 'posts_retrieve': 4, 'analytics': 1}
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def manage(env, *args):
+    subprocess.run([sys.executable, 'manage.py', *args], cwd=PROJECT_DIR,  # nosec B603
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+async def wait_until_up(session, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f'{base_url}/api/posts/') as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f'Server at {base_url} did not start')
+
+
+async def drive(base_url, token, post_ids, concurrency, warmup, duration):
+    """
+    Closed loop: concurrency clients each send the next request as soon as
+    the previous one is answered. Requests finishing during the warm-up
+    are not counted.
+    """
+    headers = {'Authorization': f'Bearer {token}'}
+    today = time.strftime('%Y-%m-%d')
+    month_ago = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 30 * 86400))
+    paths = {
+        'activity': lambda: '/api/users/activity/',
+        'posts_list': lambda: '/api/posts/',
+        'posts_retrieve': lambda: f'/api/posts/{random.choice(post_ids)}/',
+        'analytics': lambda: (f'/api/posts/analytics/?date_from={month_ago}'
+                              f'&date_to={today}'),
+    }
+    names, weights = list(MIX), list(MIX.values())
+    latencies, errors = [], 0
+    started = time.monotonic()
+    recording_from, stop_at = started + warmup, started + warmup + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            path = paths[random.choices(names, weights)[0]]()
+            sent = time.monotonic()
+            try:
+                async with session.get(base_url + path, headers=headers) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if sent >= recording_from:
+                latencies.append(time.monotonic() - sent)
+                errors += not ok
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def benchmark(name, args, env):
+    port = args.port + list(SERVERS).index(name)
+    base_url = f'http://127.0.0.1:{port}'
+    command = [sys.executable, '-m'] + [
+        part.format(port=port, workers=args.workers, threads=args.threads)
+        for part in SERVERS[name]]
+    if name == 'asgi':
+        env = {**env, 'ASYNC_READ_VIEWS': '1'}
+    server = subprocess.Popen(command, cwd=PROJECT_DIR, env=env)  # nosec B603
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, base_url)
+            async with session.post(f'{base_url}/api/users/login/', json={
+                    'username': 'asgi0', 'password': 'Seeded123'}) as response:
+                token = (await response.json())['access']
+        return await drive(base_url, token, list(range(1, args.posts + 1)),
+                           args.concurrency, args.warmup, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ,
+               'DB_NAME': os.path.join(directory, 'benchmark.sqlite3'),
+               'CACHE_LOCATION': os.path.join(directory, 'cache'),
+               'LOG_SAMPLE_RATE': '0'}
+        manage(env, 'migrate')
+        manage(env, 'seed', '--users', str(args.users), '--posts', str(args.posts),
+               '--likes', str(args.likes), '--prefix', 'asgi')
+        report = {
+            'config': vars(args),
+            'servers': {name: asyncio.run(benchmark(name, args, env))
+                        for name in SERVERS},
+        }
+    wsgi, asgi = report['servers']['wsgi'], report['servers']['asgi']
+    if wsgi['requests_per_second']:
+        report['asgi_speedup'] = round(
+            asgi['requests_per_second'] / wsgi['requests_per_second'], 2)
+    output = json.dumps(report, indent=4)
+    path = BENCHMARK_DIR / 'results' / 'asgi_vs_wsgi.json'
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Threads per gunicorn worker')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--posts', type=int, default=2_000)
+    parser.add_argument('--likes', type=int, default=20_000)
+    parser.add_argument('--port', type=int, default=8600)
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+"""
+Compares serialization time and bytes per like/unlike response for the
+full (post + user) and compact response modes.
+
+    python -m benchmarks.like_responses --iterations 20000
+"""
+import argparse
+import json
+import os
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "socialnetwork.settings")
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api.models import ApiUser, Post  # noqa: E402
+from api.serializers import PostSerializer, UserSerializer  # noqa: E402
+
+
+def full_response(post, user):
+    return JSONRenderer().render({
+        'status': 'Post liked successfully',
+        'post': PostSerializer(post).data,
+        'user': UserSerializer(user).data
+    })
+
+
+def compact_response(post, user):
+    return JSONRenderer().render({
+        'post_id': post.id,
+        'liked': True,
+        'like_count': post.like_count
+    })
+
+
+def run(iterations, body_size):
+    user = ApiUser(public_id=1, username='benchuser', last_login=timezone.now(),
+                   last_request=timezone.now())
+    post = Post(id=1, user=user, title='Benchmark post', body='x' * body_size,
+                pub_date=timezone.now(), like_count=42)
+    results = {}
+    for name, build in (('full', full_response), ('compact', compact_response)):
+        seconds = timeit.timeit(lambda: build(post, user), number=iterations)
+        results[name] = {
+            'us_per_response': round(seconds / iterations * 1e6, 2),
+            'bytes_per_response': len(build(post, user)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--body-size', type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.iterations, args.body_size), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures logins per second per core for each password hashing policy, with
+hashing inline on the request thread and on the HashingPool. A login is
+one ApiUser.verify_password call against a hash made with the policy's
+current costs.
+
+    python -m benchmarks.password_hashing --logins 50 --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "socialnetwork.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from api.hashers import (HashingPool, _check_password,  # noqa: E402
+                         make_password)
+from api.models import ApiUser  # noqa: E402
+
+PASSWORD = 'Benchmark123'
+
+# Settings holding the costs of each policy
+COST_SETTINGS = {
+    'argon2': ('PASSWORD_ARGON2_TIME_COST', 'PASSWORD_ARGON2_MEMORY_COST',
+               'PASSWORD_ARGON2_PARALLELISM'),
+    'scrypt': ('PASSWORD_SCRYPT_WORK_FACTOR', 'PASSWORD_SCRYPT_BLOCK_SIZE',
+               'PASSWORD_SCRYPT_PARALLELISM'),
+    'pbkdf2': ('PASSWORD_PBKDF2_ITERATIONS',),
+}
+
+
+def policy_hashers(policy):
+    classes = settings.PASSWORD_HASHER_CLASSES
+    return [classes[policy]] + [path for name, path in classes.items() if name != policy]
+
+
+def inline(user, logins):
+    started = time.perf_counter()
+    for _ in range(logins):
+        user.verify_password(PASSWORD)
+    return logins / (time.perf_counter() - started)
+
+
+def pooled(pool, encoded, logins, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda _: pool.run(_check_password, PASSWORD, encoded),
+                          range(logins)))
+    return logins / (time.perf_counter() - started)
+
+
+def run(logins, workers):
+    pool = HashingPool(workers)
+    pool.run(os.getpid)  # start the workers outside the measurement
+    results = {}
+    try:
+        for policy in settings.PASSWORD_HASHER_CLASSES:
+            with override_settings(PASSWORD_HASHERS=policy_hashers(policy)):
+                encoded = make_password(PASSWORD)
+                per_core = inline(ApiUser(username='benchuser', password_hash=encoded),
+                                  logins)
+                pool_rate = pooled(pool, encoded, logins * workers, 2 * workers)
+            results[policy] = {
+                'costs': {name: getattr(settings, name)
+                          for name in COST_SETTINGS[policy]},
+                'inline_logins_per_second_per_core': round(per_core, 1),
+                'ms_per_login': round(1000 / per_core, 2),
+                'pool_logins_per_second': round(pool_rate, 1),
+                'pool_logins_per_second_per_worker': round(pool_rate / workers, 1),
+            }
+    finally:
+        pool.shutdown()
+    return {'workers': workers, 'cpus': os.cpu_count(), 'policies': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=20,
+                        help='Logins timed inline, and per worker on the pool')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    print(json.dumps(run(args.logins, args.workers), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the unique likers estimated from the daily HyperLogLog sketches
+with exact COUNT(DISTINCT user_id) over the Like table, per day and over
+the whole range. Both read the database configured by DB_NAME, seeded
+beforehand:
+
+    DB_NAME=/tmp/likes.sqlite3 python manage.py migrate
+    DB_NAME=/tmp/likes.sqlite3 python manage.py seed --users 10000 \\
+        --posts 100000 --likes 1000000 --days 30 --skip-counters
+    DB_NAME=/tmp/likes.sqlite3 python manage.py rebuild_like_sketches
+    DB_NAME=/tmp/likes.sqlite3 python -m benchmarks.unique_likers --days 30
+"""
+import argparse
+import json
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "socialnetwork.settings")
+django.setup()
+
+from django.db.models import Count  # noqa: E402
+from django.db.models.functions import TruncDate  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from api.hyperloglog import (STANDARD_ERROR, daily_unique_users,  # noqa: E402
+                             unique_users)
+from api.models import Like  # noqa: E402
+
+
+def exact_daily(date_from, date_to):
+    return dict(Like.objects.annotate(day=TruncDate('date'))
+                .filter(day__range=[date_from, date_to]).order_by()
+                .values_list('day').annotate(users=Count('user_id', distinct=True)))
+
+
+def exact_total(date_from, date_to):
+    return Like.objects.filter(date__date__range=[date_from, date_to])\
+        .aggregate(users=Count('user_id', distinct=True))['users']
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def error(estimate, exact):
+    return round(abs(estimate - exact) / exact, 4) if exact else 0.0
+
+
+def run(days, repeat):
+    date_to = timezone.localdate()
+    date_from = date_to - timezone.timedelta(days=days - 1)
+    results = {'likes': Like.objects.filter(date__date__gte=date_from).count(),
+               'days': days, 'standard_error': round(STANDARD_ERROR, 4)}
+    for name, sketch, exact in (('daily', daily_unique_users, exact_daily),
+                                ('range', unique_users, exact_total)):
+        estimated, sketch_seconds = timed(lambda: sketch(date_from, date_to), repeat)
+        counted, exact_seconds = timed(lambda: exact(date_from, date_to), repeat)
+        if name == 'daily':
+            errors = [error(estimated.get(day, 0), count)
+                      for day, count in counted.items()]
+            accuracy = {'max_error': max(errors, default=0.0)}
+        else:
+            accuracy = {'estimate': estimated, 'exact': counted,
+                        'error': error(estimated, counted)}
+        results[name] = {
+            **accuracy,
+            'sketch_seconds': round(sketch_seconds, 3),
+            'exact_seconds': round(exact_seconds, 3),
+            'speedup': round(exact_seconds / sketch_seconds, 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.days, args.repeat), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "socialnetwork.settings")
+# Async requests run their queries in a thread of their own, so persistent
+# connections would be left behind by every request
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
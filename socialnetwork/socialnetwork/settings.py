@@ -18,6 +18,15 @@ from typing import List
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# KEY=value lines in the repository .env fill in environment variables that
+# are not already set
+ENV_FILE = BASE_DIR.parent / '.env'
+if ENV_FILE.exists():
+    for line in ENV_FILE.read_text().splitlines():
+        name, separator, value = line.partition('=')
+        if separator and not name.lstrip().startswith('#'):
+            os.environ.setdefault(name.strip(), value.strip().strip('"\''))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
@@ -45,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,11 +89,60 @@ WSGI_APPLICATION = "socialnetwork.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE picks "sqlite3" (default) or "postgresql". Connections are kept
+# open for DB_CONN_MAX_AGE seconds and health-checked before reuse.
+# Setting DB_REPLICA_NAME (SQLite file) or DB_REPLICA_HOST (PostgreSQL) adds
+# a "replica" database that post lists and analytics read from.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'socialnetwork'),
+            'USER': os.environ.get('DB_USER', 'socialnetwork'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DB_REPLICA_HOST'],
+            'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
+    if os.environ.get('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.environ['DB_REPLICA_NAME'],
+        }
+
+if 'replica' in DATABASES:
+    # Tests read the replica through the primary's test database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the
+# writer, NORMAL sync is safe in WAL mode, and writers wait busy_timeout ms
+# for the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
 }
 
 # Password validation
@@ -104,13 +163,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: PASSWORD_HASHER picks the hasher for new passwords.
+# The others stay listed so older hashes still verify; they, and hashes
+# made with other costs, are rehashed on the next successful login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+PASSWORD_HASHER_CLASSES = {
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+    'scrypt': 'api.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER]
+# Argon2id costs: passes, memory in KiB and lanes
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))
+# Scrypt costs: N, r and p
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 720000))
+# Worker processes that hash and verify passwords off the request threads;
+# 0 hashes inline
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 0))
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -153,6 +237,80 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Seconds a compact snapshot of a token's user is cached for authentication.
+# Saving or deleting the user drops it early.
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Buffered ApiUser.last_request writes, flushed after this many seconds, also
+# by a background thread when the worker is idle, or once this many distinct
+# users are pending. A killed worker loses up to this many seconds of hits.
+LAST_SEEN_FLUSH_INTERVAL = 30
+LAST_SEEN_FLUSH_SIZE = 500
+
+# Analytics ranges that end before today are only invalidated by per-day
+# version bumps and can be cached for long; ranges including today are not
+ANALYTICS_CLOSED_RANGE_TIMEOUT = 60 * 60 * 24
+ANALYTICS_OPEN_RANGE_TIMEOUT = 60
+# Longest analytics range in days. The cache key of a range reads the version
+# of every one of its days.
+ANALYTICS_MAX_DAYS = 5 * 366
+# Stampede protection: how long one worker may hold a recompute lease, how
+# long others wait for it on a cold miss, how long expired entries may still
+# be served while a recompute runs, and how eagerly entries refresh early
+ANALYTICS_LEASE_TIMEOUT = 30
+ANALYTICS_LEASE_WAIT = 2
+ANALYTICS_STALE_GRACE = 5 * 60
+ANALYTICS_EARLY_REFRESH_BETA = 1.0
+# Like series: rows read per chunk into the bucketing arrays, and limits on
+# the number of hourly buckets and of top posts per bucket of a request
+ANALYTICS_CHUNK_SIZE = 10000
+ANALYTICS_MAX_BUCKETS = 24 * 366
+ANALYTICS_MAX_TOP_POSTS = 100
+
+# Home timelines: entries kept per user, the follower count from which an
+# author's posts are fanned in on read instead of fanned out on write, the
+# followers written per fan-out batch, and how many received posts a
+# timeline is trimmed after on average
+FEED_TIMELINE_SIZE = 800
+FEED_FANOUT_THRESHOLD = int(os.environ.get('FEED_FANOUT_THRESHOLD', 10000))
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_TRIM_INTERVAL = 100
+# Fan out new posts in a background thread; 0 fans out before the response
+FEED_FANOUT_BACKGROUND = os.environ.get('FEED_FANOUT_BACKGROUND', '1') == '1'
+
+# Trending posts: a like counts half as much every TRENDING_HALF_LIFE
+# seconds. Scores are rescaled every TRENDING_RESCALE_INTERVAL seconds,
+# dropping posts whose score fell below TRENDING_MIN_SCORE likes. The top
+# TRENDING_SIZE posts are cached for TRENDING_CACHE_TIMEOUT seconds.
+TRENDING_HALF_LIFE = int(os.environ.get('TRENDING_HALF_LIFE', 6 * 60 * 60))
+TRENDING_RESCALE_INTERVAL = 24 * 60 * 60
+TRENDING_MIN_SCORE = 0.01
+TRENDING_SIZE = 100
+TRENDING_CACHE_TIMEOUT = 10
+
+# Rows read from the database and encoded per chunk by the streaming exports
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Serve activity, post list/retrieve and analytics with the async views in
+# api.async_views. asgi.py turns this on; WSGI keeps the sync viewsets.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# Request profiling: share of requests measured for the metrics endpoint
+# (0 also leaves serializers unwrapped), and the wall time above which a
+# sampled request is dumped as cProfile stats into PROFILING_CPROFILE_DIR
+# (None disables cProfile)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_CPROFILE_THRESHOLD_MS = None
+PROFILING_CPROFILE_DIR = BASE_DIR / 'logs' / 'profiles'
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Log records are handed to a queue on the request thread and written to the
+# console and files by a background listener thread. LOG_FORMAT=json writes
+# one JSON object per line to the log files. Only LOG_SAMPLE_RATE of the
+# high-volume INFO events, such as individual likes, are kept.
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'verbose')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.1))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -165,6 +323,15 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'api.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'api.log.SampleFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'file': {
@@ -173,7 +340,7 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs/django_debug.log'),
             'when': 'midnight',
             'backupCount': 7,
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
         'console': {
             'level': 'INFO',
@@ -186,26 +353,62 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs/django_error.log'),
             'when': 'midnight',
             'backupCount': 30,
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
+        },
+        'queue': {
+            'class': 'logging.handlers.QueueHandler',
+            'handlers': ['console', 'file', 'error_file'],
+            'listener': 'api.log.BackgroundListener',
+            'respect_handler_level': True,
+            'filters': ['sample'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file', 'error_file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': True,
         },
         'api': {
-            'handlers': ['console', 'file', 'error_file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': True,
         },
     },
 }
 
+# The default cache is a bounded in-process LRU in front of a shared backend
+# picked with CACHE_BACKEND: "file" (default), "redis" or "db". The "db"
+# backend needs `python manage.py createcachetable` once.
+SHARED_CACHE_BACKENDS = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', '/var/tmp/django_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'django_cache'),
+    },
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': '/var/tmp/django_cache',
-    }
+        'BACKEND': 'api.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED_ALIAS': 'shared',
+            'MAX_ENTRIES': 1000,
+            'MAX_BYTES': 16 * 1024 * 1024,
+            'LOCAL_TIMEOUT': 60,
+            'SYNC_INTERVAL': 1,
+            # Log entries read per sync. A process that falls further behind
+            # evicts whole key prefixes, such as all analytics entries.
+            'LOG_WINDOW': 4096,
+        },
+    },
+    'shared': SHARED_CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'file')],
 }